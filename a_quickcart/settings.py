@@ -41,6 +41,19 @@ else:
     FLUTTERWAVE_PUBLIC_KEY = env('FLUTTERWAVE_PUBLIC_KEY_LIVE')
 NOTIFY_EVENTS_SOURCE = env('NOTIFY_EVENTS_SOURCE')
 
+# Secret hash set on the Flutterwave dashboard, sent back in the verif-hash webhook header
+FLUTTERWAVE_SECRET_HASH = env('FLUTTERWAVE_SECRET_HASH', default='')
+
+# Flutterwave gateway client (main/utils/flutterwave.py)
+FLUTTERWAVE_BASE_URL = env('FLUTTERWAVE_BASE_URL', default='https://api.flutterwave.com/v3')
+FLUTTERWAVE_CONNECT_TIMEOUT = env.float('FLUTTERWAVE_CONNECT_TIMEOUT', default=3.05)
+FLUTTERWAVE_READ_TIMEOUT = env.float('FLUTTERWAVE_READ_TIMEOUT', default=10)
+FLUTTERWAVE_VERIFY_RETRIES = env.int('FLUTTERWAVE_VERIFY_RETRIES', default=2)
+FLUTTERWAVE_POOL_SIZE = env.int('FLUTTERWAVE_POOL_SIZE', default=10)
+# Consecutive failures before the circuit opens, and seconds before it tries again
+FLUTTERWAVE_BREAKER_THRESHOLD = env.int('FLUTTERWAVE_BREAKER_THRESHOLD', default=5)
+FLUTTERWAVE_BREAKER_RESET = env.float('FLUTTERWAVE_BREAKER_RESET', default=30)
+
 
 # CORS settings 
 CORS_ALLOWED_ORIGINS = [
@@ -63,12 +76,15 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     "django.contrib.humanize",
+    'django.contrib.postgres',  # Full-text and trigram product search
     'main.apps.MainConfig',  # Main app for the quick cart
     'corsheaders',  # CORS headers for API requests
     'administration',  # Administration app for managing the quick cart
 ]
 
 MIDDLEWARE = [
+    # Per-view latency, size and query metrics; first, so it times the rest
+    'main.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -123,6 +139,39 @@ if ENVIRONMENT == 'production' or POSTGRESS_LOCALLY == True:
         DATABASES['default'] = dj_database_url.parse(env('DATABASE_URL'))
 
 
+# Cache
+# Set CACHE_URL to a shared backend (redis/memcached) in production so every
+# worker sees the same catalog version; the local-memory default is per process.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# How long cached product feed/detail entries live (they are also invalidated on every product change)
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', default=60 * 60)
+
+# Per-client token buckets ("<requests>/<s|m|h|d>") and in-flight limits for
+# endpoints that bots can hammer; both live in the cache above
+THROTTLE_RATES = {
+    'checkout': env('THROTTLE_CHECKOUT_RATE', default='10/m'),
+    'payment_webhook': env('THROTTLE_WEBHOOK_RATE', default='300/m'),
+}
+CONCURRENCY_LIMITS = {
+    # Checkouts in flight at once, each holding a worker on a gateway call
+    'gateway': env.int('GATEWAY_CONCURRENCY_LIMIT', default=8),
+}
+# Set when behind a proxy that appends the client address to X-Forwarded-For
+THROTTLE_TRUST_X_FORWARDED_FOR = env.bool('THROTTLE_TRUST_X_FORWARDED_FOR', default=False)
+
+# Order housekeeping (manage.py expire_pending_orders / archive_orders)
+PENDING_ORDER_EXPIRY_HOURS = env.float('PENDING_ORDER_EXPIRY_HOURS', default=24)
+ORDER_ARCHIVE_AFTER_DAYS = env.float('ORDER_ARCHIVE_AFTER_DAYS', default=180)
+# How long stored checkout responses are replayed (manage.py purge_idempotency_keys)
+IDEMPOTENCY_KEY_TTL_HOURS = env.float('IDEMPOTENCY_KEY_TTL_HOURS', default=24)
+# Lets a Prometheus scraper read /owner/metrics/ with "Authorization: Bearer <token>"
+# instead of a login session; empty means logged-in owners only
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
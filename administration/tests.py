@@ -1,3 +1,277 @@
+import csv
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from main.models import Product, Order, OrderItem, ArchivedOrder, DailySales, DailyProductSales
+from main.utils.order_stats import get_order_stats
+
+
+class OrderViewQueryBudgetTests(TestCase):
+    """The admin order pages must not issue a query per order or per item"""
+
+    # session + user + stats + paginator count + orders + items
+    # + the session save SESSION_SAVE_EVERY_REQUEST does
+    ORDER_LIST_BUDGET = 9
+    ORDER_DETAIL_BUDGET = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        products = [Product.objects.create(name=f"Product {i}", price=100 + i) for i in range(5)]
+        for i in range(12):
+            order = Order.objects.create(
+                full_name=f"Customer {i}", email=f"c{i}@example.com", phone="0800", address="Lagos"
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=2, price=product.price)
+                for product in products
+            ])
+        cls.order = order
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def assertWithinBudget(self, url, budget):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{url} ran {len(queries)} queries (budget {budget}):\n"
+            + "\n".join(query["sql"] for query in queries),
+        )
+        return response
+
+    def test_order_list_query_budget(self):
+        response = self.assertWithinBudget(reverse("order_list"), self.ORDER_LIST_BUDGET)
+        self.assertContains(response, "Product 4")
+
+    def test_order_list_search_query_budget(self):
+        self.assertWithinBudget(reverse("order_list") + "?q=Customer", self.ORDER_LIST_BUDGET)
+
+    def test_order_detail_query_budget(self):
+        response = self.assertWithinBudget(
+            reverse("order_detail", args=[self.order.pk]), self.ORDER_DETAIL_BUDGET
+        )
+        self.assertContains(response, "Product 4")
+
+
+class ProductFormTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        self.client.force_login(self.user)
+        self.product = Product.objects.create(name="Lamp", price=1000, stock=5)
+
+    def edit(self, stock):
+        return self.client.post(reverse("product_edit", args=[self.product.pk]), {
+            "name": "Lamp", "description": "", "price": "1000", "stock": stock, "stock_shown": "5",
+        })
+
+    def test_bad_stock_is_rejected_not_untracked(self):
+        for stock in ("5a", "-3", "2.5"):
+            response = self.edit(stock)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "Stock must be a whole number")
+            self.product.refresh_from_db()
+            self.assertEqual(self.product.stock, 5)
+
+        self.assertRedirects(self.edit(""), reverse("admin_dashboard"))
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.stock)
+
+
+class DashboardSearchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        self.client.force_login(self.user)
+        Product.objects.create(name="Brass stand", price=100, description="Fits any lamp shade")
+        Product.objects.create(name="Lamp", price=200)
+        Product.objects.create(name="Rug", price=300)
+
+    def test_search_ranks_name_matches_first(self):
+        response = self.client.get(reverse("admin_dashboard"), {"q": "lam"})
+
+        self.assertEqual([product.name for product in response.context["products"]], ["Lamp", "Brass stand"])
+        self.assertEqual(response.context["query"], "lam")
+
+
+class ArchivedOrderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        self.client.force_login(self.user)
+        product = Product.objects.create(name="Archived Lamp", price=500)
+        self.old, self.recent, self.pending = [
+            Order.objects.create(
+                full_name=name, email=f"{name.lower()}@example.com", phone="0800",
+                address="Lagos", status=status,
+            )
+            for name, status in [("Old", "completed"), ("Recent", "completed"), ("Pending", "pending")]
+        ]
+        for order in (self.old, self.recent, self.pending):
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=500)
+        Order.objects.exclude(pk=self.recent.pk).update(created_at=timezone.now() - timedelta(days=400))
+
+    def test_archives_old_settled_orders(self):
+        self.assertEqual(get_order_stats()["total"], 3)
+
+        # The cached counts move once the archiving commits
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("archive_orders", "--once", "--max-age", "180", stdout=StringIO())
+
+        self.assertEqual(set(Order.objects.values_list("pk", flat=True)), {self.recent.pk, self.pending.pk})
+        archived = ArchivedOrder.objects.get(pk=self.old.pk)
+        self.assertEqual((archived.status, archived.total_amount), ("completed", 1000))
+        self.assertEqual(archived.items.get().product_name, "Archived Lamp")
+        self.assertEqual(get_order_stats()["total"], 2)
+
+        response = self.client.get(reverse("order_list"), {"q": "Old", "archived": "1"})
+        self.assertContains(response, "Archived Lamp")
+        response = self.client.get(reverse("order_detail", args=[self.old.pk]))
+        self.assertContains(response, "Archived Lamp")
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        cls.lamp = Product.objects.create(name="Lamp", price=1500)
+        cls.rug = Product.objects.create(name="Rug", price=4000)
+        cls.paid = Order.objects.create(
+            full_name="Ada", email="ada@example.com", phone="0800", address="Lagos, Nigeria",
+            status="paid",
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.paid, product=cls.lamp, quantity=2, price=1500),
+            OrderItem(order=cls.paid, product=cls.rug, quantity=1, price=4000),
+        ])
+        cls.pending = Order.objects.create(
+            full_name="Bola", email="bola@example.com", phone="0801", address="Abuja"
+        )
+        OrderItem.objects.create(order=cls.pending, product=cls.lamp, quantity=1, price=1500)
+        # Last year's order, outside a date filter starting this year
+        Order.objects.filter(pk=cls.pending.pk).update(created_at=timezone.now() - timedelta(days=400))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse("order_export"), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_has_one_row_per_item(self):
+        rows = list(csv.DictReader(self.export(format="csv").splitlines()))
+
+        self.assertEqual(len(rows), 3)
+        first = rows[0]
+        self.assertEqual(first["order_id"], str(self.paid.pk))
+        self.assertEqual(first["address"], "Lagos, Nigeria")
+        self.assertEqual(first["product_name"], "Lamp")
+        self.assertEqual(first["line_total"], "3000.00")
+
+    def test_csv_neutralises_formulas(self):
+        Order.objects.filter(pk=self.paid.pk).update(
+            full_name='=HYPERLINK("http://evil.example","Ada")', address="@SUM(1+1)", phone="+2348000",
+        )
+
+        first = next(csv.DictReader(self.export(format="csv").splitlines()))
+        self.assertEqual(first["full_name"], """'=HYPERLINK("http://evil.example","Ada")""")
+        self.assertEqual((first["address"], first["phone"]), ("'@SUM(1+1)", "'+2348000"))
+        # Numbers are left alone, and JSONL keeps the raw text
+        self.assertEqual(first["line_total"], "3000.00")
+        record = json.loads(self.export(format="jsonl", status="paid").splitlines()[0])
+        self.assertEqual(record["address"], "@SUM(1+1)")
+
+    def test_jsonl_filters_by_status_and_date(self):
+        since = (timezone.localdate() - timedelta(days=30)).isoformat()
+        lines = self.export(format="jsonl", status="pending").splitlines()
+        self.assertEqual([json.loads(line)["full_name"] for line in lines], ["Bola"])
+
+        self.assertEqual(self.export(format="jsonl", status="pending", since=since), "")
+
+        records = [json.loads(line) for line in self.export(format="jsonl", since=since).splitlines()]
+        self.assertEqual({record["order_id"] for record in records}, {self.paid.pk})
+        self.assertEqual(records[1]["unit_price"], "4000.00")
+
+    def test_bad_filters_are_rejected(self):
+        for params in ({"format": "xml"}, {"status": "lost"}, {"since": "yesterday"}):
+            self.assertEqual(self.client.get(reverse("order_export"), params).status_code, 400)
+
+    def test_command_writes_the_same_export(self):
+        out = StringIO()
+        call_command("export_orders", "--format", "csv", "--status", "paid", stdout=out)
+
+        rows = list(csv.DictReader(out.getvalue().splitlines()))
+        self.assertEqual([row["product_name"] for row in rows], ["Lamp", "Rug"])
+
+
+class ProductImportViewTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        self.client.force_login(user)
+
+    def test_upload_reports_rows(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile("catalog.csv", b"name,price,stock\nLamp,1500,4\nRug,,\n")
+        response = self.client.post(reverse("product_import"), {"file": upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["report"]["created"], 1)
+        self.assertContains(response, "A new product needs price")
+        self.assertEqual(Product.objects.get().stock, 4)
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        self.client.force_login(user)
+        lamp = Product.objects.create(name="Lamp", price=1500)
+        today = timezone.localdate()
+        DailySales.objects.bulk_create([
+            DailySales(date=today - timedelta(days=offset), orders=2, units=3, revenue=4500)
+            for offset in range(700)
+        ])
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(date=today - timedelta(days=offset), product=lamp, product_name="Lamp", units=3, revenue=4500)
+            for offset in range(700)
+        ])
+
+    def test_reads_only_the_rollups(self):
+        # session + user + daily rollups + top products + the session save
+        # (in a savepoint)
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse("analytics"), {"days": 730})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["totals"]["orders"], 1400)
+        self.assertEqual(len(response.context["chart"]["labels"]), 730)
+        self.assertContains(response, "Lamp")
+
+
+class MetricsEndpointTests(TestCase):
+    def test_requires_login_or_token(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        with self.settings(METRICS_TOKEN="scrape-me"):
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer scrape-me")
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 302)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertContains(response, "# TYPE http_request_duration_seconds histogram")
 
-# Create your tests here.
+        user = get_user_model().objects.create_user("owner", "owner@example.com", "secret")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 200)
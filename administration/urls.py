@@ -10,6 +10,10 @@ urlpatterns = [
     path('products/create/', views.product_create_update, name='product_create'),
     path('products/edit/<int:pk>/', views.product_create_update, name='product_edit'),
     path("products/<int:pk>/delete/", views.product_delete, name="product_delete"),
+    path("products/import/", views.product_import, name="product_import"),
     path("orders/", views.order_list, name="order_list"),
+    path("orders/export/", views.order_export, name="order_export"),
     path("orders/<int:pk>/", views.order_detail, name="order_detail"),
+    path("analytics/", views.analytics, name="analytics"),
+    path("metrics/", views.metrics, name="metrics"),
 ]
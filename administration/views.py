@@ -1,14 +1,34 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator
-from main.models import Product, Order  # Import Product model
+from main.models import (  # Import Product model
+    Product, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailySales, DailyProductSales,
+)
+from main.utils.search import search_products
+from main.utils.order_stats import get_order_stats
+from main.utils.order_state import transition_order
+from main.utils.images import schedule_product_variants
+from main.utils.exports import EXPORT_FORMATS, ExportError, export_rows, parse_day
+from main.utils.product_import import ImportFileError, import_format, import_products, read_records
+from main.utils.metrics import registry
 from django.utils.text import slugify
-from django.db.models import Q
+from django.db.models import Q, Prefetch, Max, Sum
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.utils import timezone
+from datetime import timedelta
 
+PRODUCT_IMPORT_ERRORS_SHOWN = 100
+
+# Periods (in days) the analytics page offers
+ANALYTICS_PERIODS = (30, 90, 365, 730)
 
 
 def login_view(request):
@@ -53,7 +73,9 @@ def admin_dashboard(request):
     query = request.GET.get('q', '')
     product_list = Product.objects.all()
     if query:
-        product_list = product_list.filter(name__icontains=query)
+        product_list = search_products(product_list, query)
+    else:
+        product_list = product_list.order_by('-created_at', '-id')
     paginator = Paginator(product_list, 8)  # 8 products per page
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -77,15 +99,33 @@ def product_create_update(request, pk=None):
         description = request.POST.get("description")
         price = request.POST.get("price")
         image = request.FILES.get("image")
+        stock_input = request.POST.get("stock", "").strip()
+        # Only an empty field means stock isn't tracked
+        if stock_input and not stock_input.isdigit():
+            messages.error(request, "Stock must be a whole number (0 or more), or empty to not track it.")
+            return render(request, "product_form.html", {"product": product})
+        stock = int(stock_input) if stock_input else None
 
         try:
             if product:  # update
                 product.name = name
                 product.description = description
                 product.price = price
+                update_fields = ["name", "slug", "description", "price", "updated_at"]
+                previous_variants = product.image_variants
                 if image:
                     product.image = image
-                product.save()
+                    # The old image's copies no longer apply; rebuilt (and
+                    # the old files deleted) below
+                    product.image_variants = {}
+                    update_fields += ["image", "image_variants"]
+                # Checkouts change stock concurrently; only write it when the owner edited it
+                if stock_input != request.POST.get("stock_shown", ""):
+                    product.stock = stock
+                    update_fields.append("stock")
+                product.save(update_fields=update_fields)
+                if image:
+                    schedule_product_variants(product.pk, previous_variants)
                 messages.success(request, "Product updated successfully.")
             else:  # create
                 product = Product.objects.create(
@@ -93,7 +133,10 @@ def product_create_update(request, pk=None):
                     description=description,
                     price=price,
                     image=image,
+                    stock=stock,
                 )
+                if image:
+                    schedule_product_variants(product.pk)
                 messages.success(request, "Product created successfully.")
 
             return redirect("admin_dashboard")
@@ -103,6 +146,30 @@ def product_create_update(request, pk=None):
 
     return render(request, "product_form.html", {"product": product})
 
+@login_required
+def product_import(request):
+    report = None
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        file_format = import_format(upload.name) if upload else None
+        if file_format is None:
+            messages.error(request, "Choose a .csv or .jsonl file to import.")
+        else:
+            try:
+                report = import_products(
+                    read_records(upload, file_format),
+                    dry_run=request.POST.get("dry_run") == "1",
+                )
+            except ImportFileError as e:
+                messages.error(request, str(e))
+
+    return render(request, "product_import.html", {
+        "report": report,
+        # A long list of bad rows is summarised; the command prints them all
+        "errors": report["errors"][:PRODUCT_IMPORT_ERRORS_SHOWN] if report else [],
+        "dry_run": request.POST.get("dry_run") == "1",
+    })
+
 @login_required
 def product_delete(request, pk):
     product = get_object_or_404(Product, pk=pk)
@@ -110,10 +177,30 @@ def product_delete(request, pk):
     return redirect("admin_dashboard") 
 
 
+def order_items_prefetch():
+    """Load an order's items and the product columns the templates show, in bulk"""
+    return Prefetch(
+        "items",
+        queryset=OrderItem.objects.select_related("product").only(
+            "id", "order_id", "product_id", "quantity", "price",
+            "product__id", "product__name", "product__image", "product__image_variants",
+        ),
+    )
+
+
+def archived_items_prefetch():
+    """Archived items keep their product name; the product may be gone"""
+    return Prefetch("items", queryset=ArchivedOrderItem.objects.select_related("product"))
+
+
 @login_required
 def order_list(request):
     query = request.GET.get("q", "")   # search query
-    orders = Order.objects.all()
+    archived = request.GET.get("archived") == "1"
+    if archived:
+        orders = ArchivedOrder.objects.prefetch_related(archived_items_prefetch())
+    else:
+        orders = Order.objects.prefetch_related(order_items_prefetch())
 
     if query:
         orders = orders.filter(
@@ -123,39 +210,129 @@ def order_list(request):
             Q(status__icontains=query)
         )
 
+    stats = get_order_stats()
+
     # Pagination
     paginator = Paginator(orders, 10)  # 10 orders per page
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
-    
-    # Stats
-    total_orders = Order.objects.count()
-    pending_orders = Order.objects.filter(status="pending").count()
-    paid_orders = Order.objects.filter(status="paid").count()
-    completed_orders = Order.objects.filter(status="completed").count()
-    shipped_orders = Order.objects.filter(status="shipped").count()
-    cancelled_orders = Order.objects.filter(status="cancelled").count()
 
     context = {
         "orders": page_obj,   # paginated queryset
         "query": query,       # to keep search term in template
-        "total_orders": total_orders,
-        "pending_orders": pending_orders,
-        "completed_orders": completed_orders,
-        "shipped_orders": shipped_orders,
-        "cancelled_orders": cancelled_orders,
-        "paid_orders": paid_orders,
+        "archived": archived,
+        "total_orders": stats["total"],
+        "pending_orders": stats["pending"],
+        "completed_orders": stats["completed"],
+        "shipped_orders": stats["shipped"],
+        "cancelled_orders": stats["cancelled"],
+        "paid_orders": stats["paid"],
     }
     return render(request, "orders/order_list.html", context)
 
 @login_required
 def order_detail(request, pk):
-    order = get_object_or_404(Order, pk=pk)
+    order = Order.objects.prefetch_related(order_items_prefetch()).filter(pk=pk).first()
+    if order is None:
+        # Archived orders keep their id, so old links still work (read-only)
+        order = get_object_or_404(ArchivedOrder.objects.prefetch_related(archived_items_prefetch()), pk=pk)
+        return render(request, "orders/order_detail.html", {"order": order, "archived": True})
 
     if request.method == "POST":
-        if order.status == "paid":  # only allow shipping if already paid
-            order.status = "shipped"
-            order.save()
+        transition_order(order, "shipped")  # only ships orders that are paid
         return redirect("order_detail", pk=order.pk)
 
-    return render(request, "orders/order_detail.html", {"order": order})
\ No newline at end of file
+    return render(request, "orders/order_detail.html", {"order": order})
+
+
+@login_required
+def order_export(request):
+    """
+    Stream order items joined with their orders and products as CSV or JSONL.
+    ?format=csv|jsonl, ?status= (repeatable), ?since=/?until= (YYYY-MM-DD), ?archived=1
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("format must be csv or jsonl")
+    encode, content_type = EXPORT_FORMATS[export_format]
+
+    try:
+        rows = export_rows(
+            statuses=request.GET.getlist("status"),
+            since=parse_day(request.GET.get("since"), "since"),
+            until=parse_day(request.GET.get("until"), "until"),
+            archived=request.GET.get("archived") == "1",
+        )
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(encode(rows), content_type=content_type)
+    filename = f"orders-{timezone.localdate():%Y%m%d}.{export_format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def analytics(request):
+    """Sales per day and top products, read only from the daily rollups"""
+    try:
+        days = int(request.GET.get("days", 90))
+    except ValueError:
+        days = 90
+    if days not in ANALYTICS_PERIODS:
+        days = 90
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+
+    rollups = {
+        row["date"]: row
+        for row in DailySales.objects.filter(date__range=(start, end)).values(
+            "date", "orders", "units", "revenue", "cancelled_orders"
+        )
+    }
+    series = []
+    totals = {"orders": 0, "units": 0, "revenue": 0, "cancelled_orders": 0}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = rollups.get(day, {})
+        for name in totals:
+            totals[name] += row.get(name, 0)
+        series.append((day, row))
+
+    top_products = (
+        DailyProductSales.objects.filter(date__range=(start, end))
+        .values("product_id")
+        .annotate(name=Max("product_name"), units=Sum("units"), revenue=Sum("revenue"))
+        .order_by("-revenue")[:10]
+    )
+
+    return render(request, "analytics.html", {
+        "days": days,
+        "periods": ANALYTICS_PERIODS,
+        "start": start,
+        "end": end,
+        "totals": totals,
+        "average_order": totals["revenue"] / totals["orders"] if totals["orders"] else 0,
+        "top_products": top_products,
+        "chart": {
+            "labels": [day.isoformat() for day, _ in series],
+            "revenue": [float(row.get("revenue", 0)) for _, row in series],
+            "orders": [row.get("orders", 0) for _, row in series],
+        },
+    })
+
+
+@never_cache
+def metrics(request):
+    """
+    This process's request, query, gateway and notification metrics in the
+    Prometheus text format. Owners log in; a scraper can send the
+    METRICS_TOKEN as a bearer token instead.
+    """
+    token = settings.METRICS_TOKEN
+    scraper = bool(token) and constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not (scraper or request.user.is_authenticated):
+        return redirect_to_login(request.get_full_path())
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,20 +1,38 @@
 from django.contrib import admin
-from .models import Product, Order, OrderItem
+from .models import Product, Order, OrderItem, Notification, PaymentEvent, ArchivedOrder, ArchivedOrderItem
+from django.utils.html import format_html
+from .utils.images import schedule_product_variants
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ("name", "price", "stock_display", "created_at", "updated_at")
+    list_display = ("thumbnail", "name", "price", "stock_display", "created_at", "updated_at")
     search_fields = ("name", "description")
     prepopulated_fields = {"slug": ("name",)}
     list_filter = ("created_at",)
     readonly_fields = ("created_at", "updated_at")
 
     def stock_display(self, obj):
-        # Show stock if field exists, else "N/A"
-        return getattr(obj, "stock", "N/A")
+        # Untracked products have no stock figure
+        return "N/A" if obj.stock is None else obj.stock
     stock_display.short_description = "Stock"
 
+    def thumbnail(self, obj):
+        url = obj.image_thumbnail_url()
+        if not url:
+            return ""
+        return format_html('<img src="{}" alt="" style="height:40px;width:40px;object-fit:cover">', url)
+    thumbnail.short_description = "Image"
+
+    def save_model(self, request, obj, form, change):
+        previous = obj.image_variants
+        if "image" in form.changed_data:
+            obj.image_variants = {}
+        super().save_model(request, obj, form, change)
+        if "image" in form.changed_data:
+            # Also run for a cleared image, to delete the old copies
+            schedule_product_variants(obj.pk, previous)
+
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -31,8 +49,41 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "full_name", "email", "phone", "status", "created_at")
+    list_display = ("id", "full_name", "email", "phone", "status", "total_amount", "created_at")
     list_filter = ("status", "created_at")
     search_fields = ("full_name", "email", "phone", "address")
     inlines = [OrderItemInline]
-    readonly_fields = ("created_at",)
+    readonly_fields = ("total_amount", "item_count", "created_at")
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ("title", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("dedupe_key", "title", "message")
+    readonly_fields = ("created_at", "sent_at")
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ("event_key", "event_type", "status", "attempts", "next_attempt_at", "received_at", "processed_at")
+    list_filter = ("status", "event_type")
+    search_fields = ("event_key",)
+    readonly_fields = ("received_at", "processed_at")
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    readonly_fields = ("product", "product_name", "quantity", "price")
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ("id", "full_name", "email", "status", "total_amount", "created_at", "archived_at")
+    list_filter = ("status",)
+    search_fields = ("full_name", "email", "phone", "transaction_ref")
+    inlines = [ArchivedOrderItemInline]
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from main.utils.archive import archive_orders
+from main.utils.workers import PollingCommand
+
+
+class Command(PollingCommand):
+    help = "Move completed and cancelled orders older than --max-age into the archive tables"
+    default_batch_size = 500
+    default_interval = 3600.0
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--max-age", type=float, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+            help="Days after which a settled order is archived",
+        )
+
+    def process_batch(self, batch_size):
+        before = timezone.now() - timedelta(days=self.options["max_age"])
+        return archive_orders(before, batch_size)
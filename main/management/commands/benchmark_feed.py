@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import JsonResponse
+
+from main.models import Product
+from main.utils.feed import json_response, orjson
+from main.utils.pagination import keyset_page
+from main.views import product_feed
+
+DESCRIPTION = "Hand-finished, small batch and made to last. " * 12
+
+
+def full_feed(cursor):
+    """The feed as it was built before the compact path: whole model instances"""
+    rows, has_next, next_cursor = keyset_page(Product.objects.all(), cursor, 12)
+    return {
+        "results": [
+            {
+                "id": product.id,
+                "name": product.name,
+                "slug": product.slug,
+                "description": product.description,
+                "price": str(product.price),
+                "image": product.image.url if product.image else "",
+            }
+            for product in rows
+        ],
+        "has_next": has_next,
+        "next_cursor": next_cursor,
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare bytes and time per product feed page, full models vs the compact feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=20, help="Feed pages to walk per run")
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Insert this many throwaway products first; rolled back afterwards",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["seed"]:
+                Product.objects.bulk_create(
+                    (
+                        Product(
+                            name=f"Seed product {i}", slug=f"seed-product-{i}", price=1000 + i,
+                            description=DESCRIPTION, image=f"products/seed-{i}.jpg",
+                        )
+                        for i in range(options["seed"])
+                    ),
+                    batch_size=1000,
+                )
+
+            paths = [
+                ("full models + JsonResponse", full_feed, lambda data: JsonResponse(data).content),
+                (
+                    f"compact + {'orjson' if orjson else 'json'}",
+                    lambda cursor: product_feed(cursor, ""),
+                    lambda data: json_response(data).content,
+                ),
+            ]
+            for name, build, encode in paths:
+                self.report(name, build, encode, options["pages"], options["runs"])
+
+            transaction.set_rollback(True)
+
+    def report(self, name, build, encode, pages, runs):
+        best = None
+        for _ in range(runs):
+            sizes = []
+            start = time.perf_counter()
+            cursor = ""
+            for _ in range(pages):
+                data = build(cursor)
+                sizes.append(len(encode(data)))
+                cursor = data["next_cursor"]
+                if not cursor:
+                    break
+            elapsed = (time.perf_counter() - start) / len(sizes)
+            best = elapsed if best is None else min(best, elapsed)
+
+        self.stdout.write(
+            f"{name}: {sum(sizes) / len(sizes):,.0f} bytes/page, "
+            f"{best * 1000:.2f} ms/page (best of {runs}, {len(sizes)} pages)"
+        )
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Product
+from main.utils.cache import bump_catalog_version
+from main.utils.images import build_product_variants
+
+
+class Command(BaseCommand):
+    help = "Build resized WebP/JPEG copies of local product images (backfill)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Rebuild every product, not only those without variants",
+        )
+
+    def handle(self, *args, **options):
+        if settings.USE_CLOUDINARY:
+            raise CommandError("Images are on Cloudinary, which resizes on delivery")
+
+        products = Product.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["all"]:
+            products = products.filter(image_variants={})
+
+        built = failed = 0
+        for product_id in products.order_by("pk").values_list("pk", flat=True).iterator():
+            if build_product_variants(product_id, bump_catalog=False):
+                built += 1
+            else:
+                failed += 1
+
+        if built:
+            bump_catalog_version()
+        self.stdout.write(f"Built variants for {built} products, {failed} skipped or failed")
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from main.utils.order_state import expire_pending_orders
+from main.utils.workers import PollingCommand
+
+
+class Command(PollingCommand):
+    help = "Cancel checkouts that have been pending for too long, in batches"
+    default_batch_size = 500
+    default_interval = 300.0
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--max-age", type=float, default=settings.PENDING_ORDER_EXPIRY_HOURS,
+            help="Hours an order may stay pending",
+        )
+
+    def process_batch(self, batch_size):
+        before = timezone.now() - timedelta(hours=self.options["max_age"])
+        return expire_pending_orders(before, batch_size)
@@ -0,0 +1,94 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main.models import Order, Product
+
+# Full-table scans in EXPLAIN output: Postgres "Seq Scan on t", SQLite
+# "SCAN t" without a "USING ... INDEX"
+SEQ_SCAN = re.compile(r"Seq Scan on (\w+)|\bSCAN (\w+)(?! USING)(?:\s|$)")
+
+SEED_STATUSES = ["completed"] * 14 + ["shipped"] * 2 + ["paid", "cancelled", "pending"]
+
+
+def hot_queries():
+    """(name, queryset) for the queries the storefront and owner pages run most"""
+    cutoff = timezone.now() - timedelta(minutes=15)
+    feed = Product.objects.order_by("-created_at", "-id")
+
+    queries = [
+        ("order list", Order.objects.order_by("-created_at")[:10]),
+        ("order list by status", Order.objects.filter(status="paid").order_by("-created_at")[:10]),
+        ("pending sweep", Order.objects.filter(status="pending", created_at__lte=cutoff).order_by("created_at")[:200]),
+        ("order by reference", Order.objects.filter(transaction_ref="order_1_abcdef12")),
+        ("product feed", feed[:13]),
+    ]
+
+    newest = feed.values_list("created_at", "id").first()
+    if newest:
+        # Same seek as keyset_page
+        created_at, pk = newest
+        queries.append((
+            "product feed page",
+            feed.filter(Q(created_at__lt=created_at) | Q(id__lt=pk), created_at__lte=created_at)[:13],
+        ))
+    return queries
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot order and product queries and fail if any does a full table scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Insert this many throwaway orders (and a tenth as many products) "
+                 "first, so the planner sees production-sized tables; rolled back afterwards",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["seed"]:
+                self.seed(options["seed"])
+            with connection.cursor() as cursor:
+                # Only the tables explained below; one per statement, as SQLite wants
+                for model in (Order, Product):
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+            failures = []
+            for name, queryset in hot_queries():
+                plan = queryset.explain()
+                scans = [table for match in SEQ_SCAN.finditer(plan) for table in match.groups() if table]
+                self.stdout.write(f"{name}: {'SEQ SCAN ' + ', '.join(scans) if scans else 'ok'}")
+                self.stdout.write("    " + plan.replace("\n", "\n    "))
+                if scans:
+                    failures.append(name)
+
+            # Never keep the seeded rows
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"Full table scan in: {', '.join(failures)}")
+
+    def seed(self, count):
+        Order.objects.bulk_create(
+            (
+                Order(
+                    full_name=f"Seed {i}", email=f"seed{i}@example.com", phone=f"0800{i:07d}",
+                    address="Seed", status=SEED_STATUSES[i % len(SEED_STATUSES)],
+                    transaction_ref=f"seed_{i}",
+                )
+                for i in range(count)
+            ),
+            batch_size=1000,
+        )
+        Product.objects.bulk_create(
+            (
+                Product(name=f"Seed {i}", slug=f"seed-product-{i}", price=1000)
+                for i in range(max(count // 10, 1))
+            ),
+            batch_size=1000,
+        )
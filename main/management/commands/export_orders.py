@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.utils.exports import EXPORT_FORMATS, ExportError, export_rows, parse_day
+
+
+class Command(BaseCommand):
+    help = "Stream order items joined with their orders and products as CSV or JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument(
+            "--status", action="append", default=[],
+            help="Only orders in this status (repeatable)",
+        )
+        parser.add_argument("--since", help="First order date to include (YYYY-MM-DD)")
+        parser.add_argument("--until", help="Last order date to include (YYYY-MM-DD)")
+        parser.add_argument("--archived", action="store_true", help="Export the archived orders")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        encode, _ = EXPORT_FORMATS[options["format"]]
+        try:
+            rows = export_rows(
+                statuses=options["status"],
+                since=parse_day(options["since"], "--since"),
+                until=parse_day(options["until"], "--until"),
+                archived=options["archived"],
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        written = 0
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in encode(rows):
+                    output.write(chunk)
+                    written += len(chunk)
+            elapsed = time.monotonic() - started
+            # Progress goes to stderr, so it never mixes with an export on stdout
+            self.stderr.write(f"Wrote {written} bytes to {options['output']} in {elapsed:.1f}s")
+        else:
+            for chunk in encode(rows):
+                self.stdout.write(chunk.decode(), ending="")
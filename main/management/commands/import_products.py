@@ -0,0 +1,48 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.utils.product_import import (
+    CHUNK_SIZE, IMPORT_FORMATS, ImportFileError, import_format, import_products, read_records,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update products from a CSV or JSONL file with name, slug, "
+        "description, price and stock columns. Rows whose slug exists update "
+        "that product; the others create one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="Default: from the file extension")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Check every row without writing")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or import_format(path.name)
+        if file_format is None:
+            raise CommandError("Can't tell the format from the file name, pass --format")
+
+        started = time.monotonic()
+        try:
+            with path.open("rb") as file:
+                report = import_products(
+                    read_records(file, file_format),
+                    chunk_size=options["chunk_size"],
+                    dry_run=options["dry_run"],
+                )
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        for line, message in report["errors"]:
+            self.stderr.write(f"Line {line}: {message}")
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{report['created']} created, {report['updated']} updated, "
+            f"{len(report['errors'])} errors in {elapsed:.1f}s"
+            + (" (dry run)" if options["dry_run"] else "")
+        )
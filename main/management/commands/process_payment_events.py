@@ -0,0 +1,15 @@
+from main.utils.payment_events import process_payment_events, MAX_ATTEMPTS
+from main.utils.workers import PollingCommand
+
+
+class Command(PollingCommand):
+    help = "Apply queued payment webhook events to their orders"
+    default_batch_size = 100
+    default_interval = 1.0
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+
+    def process_batch(self, batch_size):
+        return process_payment_events(batch_size, self.options["max_attempts"])
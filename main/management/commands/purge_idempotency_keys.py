@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from main.utils.idempotency import purge_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL_HOURS"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Purged {purge_idempotency_keys()} idempotency keys")
@@ -0,0 +1,142 @@
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from main.models import Order
+from main.utils.flutterwave import get_client, GatewayError
+from main.utils.order_state import transition_orders
+
+# Gateway statuses that settle a pending order
+GATEWAY_OUTCOMES = {
+    "successful": "paid",
+    "failed": "cancelled",
+}
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+
+class Command(BaseCommand):
+    help = "Verify stuck pending orders against Flutterwave and settle them in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent gateway calls")
+        parser.add_argument("--rate", type=float, default=10, help="Max gateway calls per second (0 = unlimited)")
+        parser.add_argument("--chunk-size", type=int, default=200)
+        parser.add_argument(
+            "--min-age", type=int, default=15,
+            help="Only check orders at least this many minutes old, to leave live checkouts alone",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+        parser.add_argument(
+            "--checkpoint", type=Path,
+            help="File recording the last order checked, so an interrupted run resumes after it; "
+                 "removed once a run completes",
+        )
+
+    def handle(self, *args, **options):
+        self.client = get_client()
+        self.limiter = RateLimiter(options["rate"])
+        dry_run = options["dry_run"]
+        checkpoint = options["checkpoint"]
+
+        start_after = 0
+        if checkpoint and checkpoint.exists():
+            start_after = json.loads(checkpoint.read_text())["last_order_id"]
+            self.stdout.write(f"Resuming after order {start_after}")
+
+        orders = (
+            Order.objects.filter(
+                Q(transaction_ref__isnull=False) | Q(flutterwave_transaction_id__isnull=False),
+                status="pending",
+                pk__gt=start_after,
+                created_at__lte=timezone.now() - timedelta(minutes=options["min_age"]),
+            )
+            .order_by("pk")
+            .values_list("pk", "transaction_ref", "flutterwave_transaction_id")
+            .iterator(chunk_size=options["chunk_size"])
+        )
+
+        counts = {"checked": 0, "paid": 0, "cancelled": 0, "unchanged": 0, "errors": 0}
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                chunk = list(itertools.islice(orders, options["chunk_size"]))
+                if not chunk:
+                    break
+
+                outcomes = {"paid": [], "cancelled": []}
+                for order_id, outcome in pool.map(self.check_order, chunk):
+                    counts["checked"] += 1
+                    if outcome in outcomes:
+                        outcomes[outcome].append(order_id)
+                    else:
+                        counts[outcome] += 1
+
+                for status, order_ids in outcomes.items():
+                    counts[status] += len(order_ids) if dry_run else self.settle(order_ids, status)
+                    if dry_run and order_ids:
+                        self.stdout.write(f"Would mark {status}: {', '.join(map(str, order_ids))}")
+
+                if checkpoint and not dry_run:
+                    checkpoint.write_text(json.dumps({"last_order_id": chunk[-1][0]}))
+
+        # Done: the next run starts from the beginning again, since orders
+        # left pending (unchanged or errors) here still need checking
+        if checkpoint and not dry_run:
+            checkpoint.unlink(missing_ok=True)
+
+        elapsed = time.monotonic() - started
+        rate = counts["checked"] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Checked {counts['checked']} orders in {elapsed:.1f}s ({rate:.1f}/s): "
+            f"{counts['paid']} paid, {counts['cancelled']} cancelled, "
+            f"{counts['unchanged']} unchanged, {counts['errors']} errors"
+            + (" (dry run)" if dry_run else "")
+        )
+
+    def check_order(self, row):
+        """Ask the gateway about one order; runs on a pool thread, no database access"""
+        order_id, tx_ref, transaction_id = row
+        self.limiter.wait()
+        try:
+            if transaction_id:
+                gateway_status = self.client.transaction_status(transaction_id)
+            else:
+                gateway_status = self.client.transaction_status_by_reference(tx_ref)
+        except GatewayError:
+            return order_id, "errors"
+        return order_id, GATEWAY_OUTCOMES.get(gateway_status, "unchanged")
+
+    def settle(self, order_ids, status):
+        """
+        Move the orders that are still pending to `status`. Returns how many
+        changed; a webhook may have settled some first.
+        """
+        if not order_ids:
+            return 0
+        return len(transition_orders(order_ids, status))
@@ -0,0 +1,13 @@
+from main.utils.notifications import send_pending_notifications, MAX_ATTEMPTS
+from main.utils.workers import PollingCommand
+
+
+class Command(PollingCommand):
+    help = "Deliver queued notifications from the outbox, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+
+    def process_batch(self, batch_size):
+        return send_pending_notifications(batch_size, self.options["max_attempts"])
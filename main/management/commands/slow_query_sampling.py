@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.utils.metrics import clear_slow_query_sampling, set_slow_query_sampling
+
+
+class Command(BaseCommand):
+    help = (
+        "Turn per-request slow query logging on for a sample of requests, or "
+        "--off. The flag lives in the cache, so workers only see it with a "
+        "shared CACHE_URL (e.g. Redis)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", type=float, default=0.1, help="Share of requests sampled (0-1)")
+        parser.add_argument("--threshold-ms", type=float, default=100, help="Log queries at least this slow")
+        parser.add_argument("--minutes", type=float, default=60, help="Switch itself off after this long")
+        parser.add_argument("--off", action="store_true", help="Stop sampling now")
+
+    def handle(self, *args, **options):
+        if options["off"]:
+            clear_slow_query_sampling()
+            self.stdout.write("Slow query sampling off")
+            return
+
+        if not 0 < options["rate"] <= 1:
+            raise CommandError("--rate must be between 0 and 1")
+        set_slow_query_sampling(options["rate"], options["threshold_ms"], options["minutes"] * 60)
+        self.stdout.write(
+            f"Logging queries over {options['threshold_ms']:g} ms for {options['rate']:.0%} of "
+            f"requests for {options['minutes']:g} minutes (workers pick it up within seconds)"
+        )
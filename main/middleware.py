@@ -1,3 +1,8 @@
+import time
+
+from django.db import connection
+
+from .utils.metrics import QueryRecorder, registry, slow_query_threshold
 from .utils.notifications import send_notify_event
 
 class VisitorNotificationMiddleware:
@@ -14,4 +19,48 @@ class VisitorNotificationMiddleware:
             send_notify_event(f"👤 New visitor at {path} from {ip}", "New Visitor")
             request.session["visitor_notified"] = True  # mark session as notified
 
-        return response
\ No newline at end of file
+        return response
+
+
+def view_label(match):
+    """
+    The metrics label for a resolved request: its route name, else the view
+    function's dotted path. Both are fixed per route, unlike the URL path.
+    """
+    if match is None:
+        return "unmatched"
+    if match.view_name:
+        return match.view_name
+    func = match.func
+    return f"{func.__module__}.{getattr(func, '__qualname__', type(func).__qualname__)}"
+
+
+class RequestMetricsMiddleware:
+    """
+    Records each request's latency, response size and database queries per
+    view into main.utils.metrics (served at /owner/metrics/). Goes first in
+    MIDDLEWARE so the timings cover the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = request._query_recorder = QueryRecorder(slow_query_threshold())
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        # Route name rather than path, so ids and slugs don't explode the series
+        view = view_label(request.resolver_match)
+        registry.observe("http_request_duration_seconds", elapsed, view=view)
+        registry.inc("http_requests_total", view=view, method=request.method, status=response.status_code)
+        registry.observe("db_queries_per_request", recorder.count, view=view)
+        registry.observe("db_query_duration_seconds", recorder.seconds, view=view)
+        if not response.streaming:
+            registry.observe("http_response_size_bytes", len(response.content), view=view)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_recorder.view = view_label(request.resolver_match)
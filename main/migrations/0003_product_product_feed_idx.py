@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_alter_order_options_order_flutterwave_transaction_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='product_feed_idx'),
+        ),
+    ]
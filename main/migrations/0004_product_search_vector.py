@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:09
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+POSTGRES_FORWARDS = [
+    """
+    CREATE OR REPLACE FUNCTION main_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER main_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON main_product
+    FOR EACH ROW EXECUTE FUNCTION main_product_search_vector_update()
+    """,
+    # Fire the trigger once for existing rows
+    "UPDATE main_product SET name = name",
+    "CREATE INDEX main_product_search_vector_idx ON main_product USING gin (search_vector)",
+    "CREATE INDEX main_product_name_trgm_idx ON main_product USING gin (name gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS main_product_name_trgm_idx",
+    "DROP INDEX IF EXISTS main_product_search_vector_idx",
+    "DROP TRIGGER IF EXISTS main_product_search_vector_trigger ON main_product",
+    "DROP FUNCTION IF EXISTS main_product_search_vector_update()",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS main_product_fts_ai",
+    "DROP TRIGGER IF EXISTS main_product_fts_ad",
+    "DROP TRIGGER IF EXISTS main_product_fts_au",
+    "DROP TABLE IF EXISTS main_product_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # SQLite's FTS5 table is (re)built by the post_migrate hook in main.signals
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_FORWARDS:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        statements = POSTGRES_BACKWARDS
+    elif schema_editor.connection.vendor == "sqlite":
+        statements = SQLITE_BACKWARDS
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_product_product_feed_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,8 +1,19 @@
 from django.db import models
-from django.utils.text import slugify
+from django.db.models import F, Sum
+from django.utils import timezone
 
 from django.conf import settings
 from cloudinary.models import CloudinaryField
+from django.contrib.postgres.search import SearchVectorField
+from .utils.images import variant_srcset, variant_url
+from .utils.slugs import slug_base, unique_slug
+
+
+class ProductManager(models.Manager):
+    def get_queryset(self):
+        # Only search reads the tsvector (in SQL); don't load it into every
+        # product, or into the pickled detail pages in the cache
+        return super().get_queryset().defer("search_vector")
 
 
 class Product(models.Model):
@@ -17,17 +28,51 @@ class Product(models.Model):
             ], default='static/example3.jpg')
     else:
         image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized copies of a local image, {"webp": {"400": "<path>", ...}, "jpeg": {...}};
+    # built by main.utils.images after upload (Cloudinary resizes on its own)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Units left to sell; empty means stock isn't tracked for this product.
+    # Checkout changes it with conditional UPDATEs (main.utils.inventory)
+    stock = models.PositiveIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger on Postgres (see migration 0004), unused elsewhere
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductManager()
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            # Suffix the slug ("lamp-2") instead of failing when the name is taken
+            base = slug_base(self.name)
+            taken = set(
+                Product.objects.filter(slug__startswith=base)
+                .exclude(pk=self.pk).values_list("slug", flat=True)
+            )
+            self.slug = unique_slug(base, taken)
         super().save(*args, **kwargs)
 
+    @property
+    def image_srcset(self):
+        return variant_srcset(self.image_variants, "webp")
+
+    @property
+    def image_jpeg_srcset(self):
+        return variant_srcset(self.image_variants, "jpeg")
+
+    def image_thumbnail_url(self):
+        """Smallest stored copy of the image, for list thumbnails"""
+        return variant_url(self.image_variants, "jpeg", smallest=True) or (self.image.url if self.image else "")
+
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # Backs the keyset-paginated storefront feed
+            models.Index(fields=['-created_at', '-id'], name='product_feed_idx'),
+        ]
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -48,19 +93,58 @@ class Order(models.Model):
     transaction_ref = models.CharField(max_length=100, blank=True, null=True, unique=True)
     flutterwave_transaction_id = models.CharField(max_length=100, blank=True, null=True)
     payment_method = models.CharField(max_length=50, blank=True, null=True)
+
+    # Denormalized from the order's items so lists and revenue figures never
+    # have to load items; set at checkout and kept in step by OrderItem
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    # Set while this order holds stock taken at checkout; cleared on release
+    stock_reserved = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the status as loaded, so a save can tell whether it changed
+        instance._loaded_status = dict(zip(field_names, values)).get('status')
+        return instance
+
     def get_total_amount(self):
-        """Calculate the total amount for this order"""
-        return sum(item.get_total_price() for item in self.items.all())
+        """Return the stored total amount for this order"""
+        return self.total_amount
+
+    def update_totals(self):
+        """Recompute the stored total and item count from this order's items"""
+        totals = self.items.aggregate(
+            total=Sum(F('price') * F('quantity')),
+            count=Sum('quantity'),
+        )
+        self.total_amount = totals['total'] or 0
+        self.item_count = totals['count'] or 0
+        Order.objects.filter(pk=self.pk).update(
+            total_amount=self.total_amount,
+            item_count=self.item_count,
+        )
 
     def __str__(self):
         return f"Order {self.id} - {self.full_name}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Default ordering of the owner's order list
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            # Status tiles/filters, newest first
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            # Pending-order sweeps (reconcile_payments); stays small as orders settle
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status='pending'),
+                name='order_pending_idx',
+            ),
+        ]
 
 
 class OrderItem(models.Model):
@@ -72,16 +156,191 @@ class OrderItem(models.Model):
     def get_total_price(self):
         return self.price * self.quantity
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.order.update_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.order.update_totals()
+        return result
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
 
 
-# Optional: Log completed sales separately (if you want extra reporting)
-"""class Sale(models.Model):
-    order = models.OneToOneField(Order, on_delete=models.CASCADE)
-    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+class Notification(models.Model):
+    """Outbox of notifications, sent in the background by `manage.py send_notifications`"""
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    # Stops the same event (e.g. "order 42 paid") from being queued twice
+    dedupe_key = models.CharField(max_length=100, unique=True)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.title} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+
+
+class PaymentEvent(models.Model):
+    """Inbox of raw gateway webhook events, applied by `manage.py process_payment_events`"""
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processed", "Processed"),
+        ("failed", "Failed"),
+    ]
+
+    # "<event>:<transaction id>", so gateway retries are dropped at insert time
+    event_key = models.CharField(max_length=150, unique=True)
+    event_type = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    # Also pushed ahead while a worker holds the event, so others skip it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.event_key} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='paymentevent_due_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied Idempotency-Key and the response it got, so retries
+    of a POST are answered without running it again (main.utils.idempotency)
+    """
+    STATUS_CHOICES = [
+        ("in_progress", "In progress"),
+        ("completed", "Completed"),
+    ]
+
+    # "<scope>:<client key>"
+    key = models.CharField(max_length=300, unique=True)
+    # Hash of the request body, to refuse a key reused for a different request
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="in_progress")
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_content_type = models.CharField(max_length=100, blank=True)
+    response_body = models.BinaryField(blank=True, null=True)
+
+    started_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
-        return f"Sale #{self.id} - {self.total_amount}" """
+        return f"{self.key} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_at'], name='idempotencykey_started_idx'),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+    Settled orders moved out of main_order by `manage.py archive_orders`.
+    Keeps the original order id and columns so the owner's pages can show it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    full_name = models.CharField(max_length=200)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20)
+    address = models.TextField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+
+    transaction_ref = models.CharField(max_length=100, blank=True, null=True)
+    flutterwave_transaction_id = models.CharField(max_length=100, blank=True, null=True)
+    payment_method = models.CharField(max_length=50, blank=True, null=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived order {self.id} - {self.full_name}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='archivedorder_created_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, related_name="items", on_delete=models.CASCADE)
+    # Products may be deleted long after the order was archived
+    product = models.ForeignKey(Product, related_name="+", on_delete=models.SET_NULL, null=True)
+    product_name = models.CharField(max_length=200)
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def get_total_price(self):
+        return self.price * self.quantity
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name}"
+
+
+class DailySales(models.Model):
+    """
+    Orders, units and revenue per day (by order date, in TIME_ZONE), for the
+    owner's analytics page. Kept up to date by main.utils.sales as orders
+    change status; `manage.py rebuild_sales_rollups` recomputes it.
+    """
+    date = models.DateField(unique=True)
+    # Orders counted as sold: paid, shipped or completed
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cancelled_orders = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Sales {self.date}: {self.revenue}"
+
+    class Meta:
+        verbose_name_plural = "daily sales"
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue per product per day, as DailySales"""
+    date = models.DateField()
+    # Archived sales outlive their products
+    product = models.ForeignKey(Product, related_name="+", on_delete=models.SET_NULL, null=True)
+    product_name = models.CharField(max_length=200, blank=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.product_name} {self.date}: {self.units}"
+
+    class Meta:
+        verbose_name_plural = "daily product sales"
+        constraints = [
+            models.UniqueConstraint(fields=["date", "product"], name="dailyproductsales_day_product_uniq"),
+        ]
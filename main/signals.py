@@ -1,29 +1,104 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Order
-from .utils.notifications import send_notify_event
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver, Signal
+from .models import Order, Product
+from .utils.notifications import queue_order_paid_notification
+from .utils.cache import bump_catalog_version
+from .utils.search import setup_sqlite_fts
+from .utils.order_stats import record_order_created, record_order_deleted, record_status_change
+from .utils.order_status import forget_order_status
+from .utils.inventory import release_stock
+from .utils.sales import record_new_order_sales, record_sales_change
+
+# Sent once per real status change, with order, old_status and new_status.
+# main.utils.order_state sends it for conditional updates; order_saved
+# below sends it for plain saves (e.g. from the Django admin).
+order_status_changed = Signal()
+
 
 @receiver(post_save, sender=Order)
-def order_notifications(sender, instance, created, **kwargs):
+def order_saved(sender, instance, created, **kwargs):
     """
-    Send a notification only when an order is marked as paid.
-    Works for:
-      - New order created with status 'paid'
-      - Existing order updated from another status to 'paid'
+    Count new orders and turn status changes made by save() into
+    order_status_changed
     """
-    # Only trigger if status is 'paid'
-    if instance.status != "paid":
-        return
+    old_status = getattr(instance, "_loaded_status", None)
+    instance._loaded_status = instance.status
+    if created:
+        record_order_created(instance.status)
+        if instance.status == "paid":
+            queue_order_paid_notification(instance)
+        if instance.status != "pending":
+            # Its items are saved after the order; count its sales once they are in
+            transaction.on_commit(partial(record_new_order_sales, instance.pk, instance.status))
+    elif old_status and old_status != instance.status:
+        order_status_changed.send(
+            sender=Order, order=instance, old_status=old_status, new_status=instance.status
+        )
+
+
+@receiver(order_status_changed)
+def order_notifications(sender, order, new_status, **kwargs):
+    """
+    Queue a notification when an order is marked as paid. The outbox row is
+    written in the same transaction as the order; the send_notifications
+    worker delivers it, and its dedupe key makes a repeat a no-op.
+    """
+    if new_status == "paid":
+        queue_order_paid_notification(order)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_catalog_changed(sender, instance, **kwargs):
+    """
+    Invalidate the cached product feed and detail pages whenever a product
+    is created, edited or deleted. Only once committed: bumped earlier, a
+    concurrent cache miss could store the old rows under the new version.
+    """
+    transaction.on_commit(bump_catalog_version)
 
-    # Optional: avoid sending multiple notifications if already sent
-    if getattr(instance, "_notify_paid_sent", False):
+
+@receiver(post_migrate)
+def product_search_index(sender, using, **kwargs):
+    """
+    Keep the SQLite FTS5 product index in place for local runs. Postgres
+    maintains its search vector with a trigger created in migration 0004.
+    """
+    if sender.name != "main":
         return
+    from django.db import connections
+    setup_sqlite_fts(connections[using])
+
+
+@receiver(order_status_changed)
+def order_status_cache(sender, order, **kwargs):
+    """Drop the cached status polled by the payment confirmation page"""
+    forget_order_status(order.transaction_ref)
+
+
+@receiver(order_status_changed)
+def order_stats_changed(sender, old_status, new_status, **kwargs):
+    """Keep the cached order status counts in step without recounting"""
+    record_status_change(old_status, new_status)
+
+
+@receiver(order_status_changed)
+def order_stock_released(sender, order, new_status, **kwargs):
+    """Put back the stock of cancelled (and expired) orders"""
+    if new_status == "cancelled":
+        release_stock(order.pk)
+
+
+@receiver(order_status_changed)
+def order_sales_rollups(sender, order, old_status, new_status, **kwargs):
+    """Move the order in or out of the daily sales rollups, in the same transaction"""
+    record_sales_change(order, old_status, new_status)
 
-    # Send the notification
-    send_notify_event(
-        f"✅ Order Paid!\nOrder ID: {instance.id}\nCustomer: {instance.full_name}\nTotal: {instance.get_total_amount()}",
-        "Order Paid"
-    )
 
-    # Mark this instance so multiple saves in same request/session don’t resend
-    instance._notify_paid_sent = True
+@receiver(post_delete, sender=Order)
+def order_stats_deleted(sender, instance, **kwargs):
+    record_order_deleted(getattr(instance, "_loaded_status", None) or instance.status)
+    forget_order_status(instance.transaction_ref)
@@ -1,3 +1,1128 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .management.commands.explain_hot_queries import SEQ_SCAN
+from .models import (
+    DailyProductSales, DailySales, IdempotencyKey, Notification, Order, OrderItem, PaymentEvent, Product,
+)
+from .utils.flutterwave import CircuitBreaker, CircuitOpen, FlutterwaveClient, GatewayError, reset_client
+from .signals import order_status_changed
+from .utils.cache import get_catalog_version
+from .utils.feed import image_url
+from .utils.images import build_product_variants
+from .utils.inventory import release_stock
+from .utils.order_state import transition_order, transition_orders
+from .utils.payment_events import process_payment_events
+from .utils.product_import import import_products, read_records
+from .utils.sales import rebuild_sales_rollups
+from .utils.notifications import queue_notify_event, send_pending_notifications
+from .utils.metrics import MetricsRegistry, clear_slow_query_sampling, registry, set_slow_query_sampling
+from .utils.throttle import ConcurrencyLimit
+
+
+class StubGateway:
+    """
+    Local HTTP server standing in for the Flutterwave API. `responses` is a
+    list of (status, body) popped per request; the last one repeats. It may
+    also be a callable (method, path) -> (status, body). Bytes bodies are sent
+    as they are, anything else as JSON.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses if callable(responses) else list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                stub.requests.append((self.command, self.path, self.rfile.read(length)))
+                status, body = stub.next_response(self.command, self.path)
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v3"
+
+    def next_response(self, method, path):
+        if callable(self.responses):
+            return self.responses(method, path)
+        with self._lock:
+            return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_client(url, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=3, reset_timeout=60))
+    return FlutterwaveClient(url, "sk_test", connect_timeout=1, read_timeout=2, **kwargs)
+
+
+class FlutterwaveClientTests(SimpleTestCase):
+    def test_create_payment_returns_link(self):
+        with StubGateway([(200, {"status": "success", "data": {"link": "https://pay/abc"}})]) as stub:
+            client = make_client(stub.url)
+            self.assertEqual(client.create_payment({"tx_ref": "order_1_x"}), "https://pay/abc")
+
+        method, path, body = stub.requests[0]
+        self.assertEqual((method, path), ("POST", "/v3/payments"))
+        self.assertEqual(json.loads(body)["tx_ref"], "order_1_x")
+
+    def test_verify_retries_server_errors(self):
+        ok = {"status": "success", "data": {"status": "successful"}}
+        with StubGateway([(502, {}), (503, {}), (200, ok)]) as stub:
+            client = make_client(stub.url, verify_retries=2)
+            self.assertTrue(client.verify_transaction("123"))
+
+        self.assertEqual(len(stub.requests), 3)
+        stats = client.stats.snapshot()["verify_transaction"]
+        self.assertEqual((stats["calls"], stats["errors"], stats["retries"]), (3, 2, 2))
+
+    def test_create_payment_is_not_retried(self):
+        with StubGateway([(500, {})]) as stub:
+            client = make_client(stub.url)
+            with self.assertRaises(GatewayError):
+                client.create_payment({})
+        self.assertEqual(len(stub.requests), 1)
+
+    def test_non_json_response_is_a_gateway_error(self):
+        with StubGateway([(200, b"<html>Bad gateway</html>")]) as stub:
+            client = make_client(stub.url, verify_retries=0)
+            with self.assertRaises(GatewayError):
+                client.verify_transaction("123")
+            with self.assertRaises(GatewayError):
+                client.create_payment({})
+
+    def test_circuit_opens_and_fails_fast(self):
+        with StubGateway([(500, {})]) as stub:
+            client = make_client(stub.url, verify_retries=0)
+            for _ in range(3):
+                with self.assertRaises(GatewayError):
+                    client.verify_transaction("123")
+            with self.assertRaises(CircuitOpen):
+                client.verify_transaction("123")
+
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(client.breaker.state, "open")
+        self.assertEqual(client.stats.snapshot()["verify_transaction"]["rejected"], 1)
+
+
+class ReconcilePaymentsTests(TestCase):
+    GATEWAY_STATUSES = {"1001": "successful", "1002": "failed", "1003": "pending"}
+
+    def gateway(self, method, path):
+        transaction_id = path.split("/")[-2]
+        if transaction_id not in self.GATEWAY_STATUSES:
+            return 500, {}
+        return 200, {"status": "success", "data": {"status": self.GATEWAY_STATUSES[transaction_id]}}
+
+    def setUp(self):
+        self.orders = {}
+        for transaction_id in ["1001", "1002", "1003", "1004"]:
+            self.orders[transaction_id] = Order.objects.create(
+                full_name="Ada", email="ada@example.com", phone="0800", address="Lagos",
+                transaction_ref=f"order_{transaction_id}", flutterwave_transaction_id=transaction_id,
+            )
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def reconcile(self, url, *args):
+        out = StringIO()
+        with override_settings(FLUTTERWAVE_BASE_URL=url, FLUTTERWAVE_VERIFY_RETRIES=0):
+            reset_client()
+            try:
+                call_command("reconcile_payments", "--rate", "0", *args, stdout=out)
+            finally:
+                reset_client()
+        return out.getvalue()
+
+    def statuses(self):
+        return {
+            transaction_id: Order.objects.get(pk=order.pk).status
+            for transaction_id, order in self.orders.items()
+        }
+
+    def test_settles_orders_from_gateway_status(self):
+        with StubGateway(self.gateway) as stub:
+            output = self.reconcile(stub.url, "--workers", "4", "--chunk-size", "2")
+
+        self.assertEqual(self.statuses(), {
+            "1001": "paid", "1002": "cancelled", "1003": "pending", "1004": "pending",
+        })
+        self.assertIn("1 paid, 1 cancelled, 1 unchanged, 1 errors", output)
+        self.assertTrue(Notification.objects.filter(dedupe_key=f"order-paid-{self.orders['1001'].pk}").exists())
+
+    def test_dry_run_writes_nothing(self):
+        with StubGateway(self.gateway) as stub:
+            output = self.reconcile(stub.url, "--dry-run")
+
+        self.assertEqual(set(self.statuses().values()), {"pending"})
+        self.assertIn("(dry run)", output)
+
+    def test_checkpoint_resumes_and_is_removed_after_a_full_run(self):
+        checkpoint = Path(tempfile.mkdtemp()) / "reconcile.json"
+        self.addCleanup(shutil.rmtree, checkpoint.parent)
+        checkpoint.write_text(json.dumps({"last_order_id": self.orders["1001"].pk}))
+
+        with StubGateway(self.gateway) as stub:
+            output = self.reconcile(stub.url, "--checkpoint", str(checkpoint))
+            self.assertIn(f"Resuming after order {self.orders['1001'].pk}", output)
+            self.assertIn("Checked 3 orders", output)
+            self.assertFalse(checkpoint.exists())
+
+            # The next run starts over, so orders left pending are checked again
+            output = self.reconcile(stub.url, "--checkpoint", str(checkpoint))
+        self.assertIn("Checked 3 orders", output)
+        self.assertEqual(self.statuses()["1001"], "paid")
+
+
+class PaymentCallbackTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(
+            full_name="Ada", email="ada@example.com", phone="0800", address="Lagos",
+        )
+        self.tx_ref = f"order_{self.order.pk}_abc"
+        Order.objects.filter(pk=self.order.pk).update(transaction_ref=self.tx_ref)
+
+    def callback(self, status="completed"):
+        return self.client.get(reverse("payment_callback"), {
+            "status": status, "tx_ref": self.tx_ref, "transaction_id": "555",
+        })
+
+    def poll(self):
+        return self.client.get(reverse("payment_status", args=[self.tx_ref])).json()["status"]
+
+    def test_completed_callback_defers_verification(self):
+        # No gateway is reachable here: the callback must not call it
+        with override_settings(FLUTTERWAVE_BASE_URL="http://127.0.0.1:9/v3"):
+            reset_client()
+            response = self.callback()
+        reset_client()
+
+        self.assertTemplateUsed(response, "main/payment/payment_pending.html")
+        self.assertEqual(self.poll(), "pending")
+        self.assertTrue(PaymentEvent.objects.filter(event_key="callback.completed:555").exists())
+
+        ok = {"status": "success", "data": {"status": "successful"}}
+        with StubGateway([(200, ok)]) as stub, override_settings(FLUTTERWAVE_BASE_URL=stub.url):
+            reset_client()
+            with self.captureOnCommitCallbacks(execute=True):
+                process_payment_events()
+        reset_client()
+
+        self.assertEqual(stub.requests[0][1], "/v3/transactions/555/verify")
+        self.assertEqual(self.poll(), "paid")
+        self.assertTemplateUsed(self.callback(), "main/payment/payment_success.html")
+
+    def test_unsuccessful_callback_cancels(self):
+        response = self.callback(status="cancelled")
+
+        self.assertTemplateUsed(response, "main/payment/payment_error.html")
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, "cancelled")
+        self.assertFalse(PaymentEvent.objects.exists())
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        queue_notify_event("Order 1 paid", "Order Paid", dedupe_key="order-paid-1")
+
+    def test_dedupe_key_queues_once(self):
+        queue_notify_event("Order 1 paid again", "Order Paid", dedupe_key="order-paid-1")
+        self.assertEqual(Notification.objects.get().message, "Order 1 paid")
+
+    def test_sends_claimed_batch_once(self):
+        def deliver(message, title):
+            # Claimed before delivery, so a second worker finds nothing due
+            self.assertEqual(send_pending_notifications(), 0)
+
+        with mock.patch("main.utils.notifications.deliver_notify_event", side_effect=deliver) as sent:
+            out = StringIO()
+            call_command("send_notifications", "--once", stdout=out)
+
+        sent.assert_called_once_with("Order 1 paid", "Order Paid")
+        self.assertIn("Processed 1", out.getvalue())
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ("sent", 1))
+        self.assertIsNotNone(notification.sent_at)
+
+    def test_failures_back_off_then_give_up(self):
+        with mock.patch(
+            "main.utils.notifications.deliver_notify_event",
+            side_effect=requests.ConnectionError("down"),
+        ) as deliver:
+            self.assertEqual(send_pending_notifications(max_attempts=3), 1)
+            notification = Notification.objects.get()
+            self.assertEqual((notification.status, notification.attempts), ("pending", 1))
+            # 30s, +-20% jitter
+            self.assertGreater(notification.next_attempt_at, timezone.now() + timedelta(seconds=20))
+            self.assertEqual(send_pending_notifications(max_attempts=3), 0)
+
+            for _ in range(2):
+                Notification.objects.update(next_attempt_at=timezone.now())
+                send_pending_notifications(max_attempts=3)
+            self.assertEqual(deliver.call_count, 3)
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ("failed", 3))
+        self.assertEqual(notification.last_error, "down")
+        Notification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_pending_notifications(max_attempts=3), 0)
+
+
+@override_settings(FLUTTERWAVE_SECRET_HASH="s3cret")
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(
+            full_name="Ada", email="ada@example.com", phone="0800", address="Lagos",
+            transaction_ref="order_1_abc",
+        )
+        self.event = {
+            "event": "charge.completed",
+            "data": {"id": 777, "tx_ref": "order_1_abc", "status": "successful"},
+        }
+
+    def webhook(self, payload, signature="s3cret"):
+        return self.client.post(
+            reverse("payment_webhook"), json.dumps(payload), content_type="application/json",
+            HTTP_VERIF_HASH=signature,
+        )
+
+    def test_replayed_event_is_stored_and_applied_once(self):
+        self.assertEqual(self.webhook(self.event).status_code, 200)
+        self.assertEqual(self.webhook(self.event).status_code, 200)
+        self.assertEqual(PaymentEvent.objects.get().event_key, "charge.completed:777")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_payment_events(), 1)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, "paid")
+        self.assertEqual(Notification.objects.count(), 1)
+
+        # A replay after processing is dropped at insert, and nothing is left to apply
+        self.assertEqual(self.webhook(self.event).status_code, 200)
+        self.assertEqual(PaymentEvent.objects.get().status, "processed")
+        self.assertEqual(process_payment_events(), 0)
+
+    def test_rejects_unsigned_and_malformed_events(self):
+        self.assertEqual(self.webhook(self.event, signature="wrong").status_code, 401)
+        with override_settings(FLUTTERWAVE_SECRET_HASH=""), self.assertLogs("main.views", "ERROR"):
+            self.assertEqual(self.webhook(self.event).status_code, 401)
+
+        for payload in (
+            {"event": "charge.completed", "data": ["not", "a", "dict"]},
+            {"event": ["charge.completed"], "data": {"id": 1}},
+            {"event": "charge.completed", "data": {"id": {"nested": 1}}},
+            {"event": "x" * 51, "data": {"id": 1}},
+            {"event": "charge.completed", "data": {"tx_ref": "r" * 100}},
+        ):
+            self.assertEqual(self.webhook(payload).status_code, 400, payload)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_failed_events_back_off_and_open_circuit_is_not_an_attempt(self):
+        PaymentEvent.objects.create(
+            event_key="callback.completed:9", event_type="callback.completed",
+            payload={"data": {"id": 9, "tx_ref": "order_1_abc"}},
+        )
+
+        with mock.patch("main.utils.payment_events.get_client") as get_client:
+            get_client.return_value.transaction_status.side_effect = GatewayError("down")
+            self.assertEqual(process_payment_events(), 0)
+            event = PaymentEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), ("pending", 1))
+            self.assertGreater(event.next_attempt_at, timezone.now() + timedelta(seconds=20))
+            # Not due yet
+            self.assertEqual(process_payment_events(), 0)
+            self.assertEqual(PaymentEvent.objects.get().attempts, 1)
+
+            PaymentEvent.objects.update(next_attempt_at=timezone.now())
+            get_client.return_value.transaction_status.side_effect = CircuitOpen("open")
+            get_client.return_value.breaker.reset_timeout = 30
+            process_payment_events()
+            event = PaymentEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), ("pending", 1))
+            self.assertGreater(event.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+
+class OrderStateTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(
+            full_name="Ada", email="ada@example.com", phone="0800", address="Lagos",
+        )
+        self.changes = []
+        order_status_changed.connect(self.record, sender=Order)
+        self.addCleanup(order_status_changed.disconnect, self.record, sender=Order)
+
+    def record(self, sender, order, old_status, new_status, **kwargs):
+        self.changes.append((order.pk, old_status, new_status))
+
+    def test_first_transition_wins(self):
+        stale = Order.objects.get(pk=self.order.pk)
+
+        # The savepoint around the conditional UPDATE, the "Order Paid" outbox
+        # insert, the day's sales rollup upsert and the lookup of the order's
+        # items (none here), and its release
+        with self.assertNumQueries(6):
+            self.assertTrue(transition_order(self.order, "paid"))
+        # A late cancel from a copy loaded before the payment loses
+        self.assertFalse(transition_order(stale, "cancelled"))
+
+        self.assertEqual(stale.status, "paid")
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, "paid")
+        self.assertEqual(self.changes, [(self.order.pk, "pending", "paid")])
+
+    def test_transition_writes_extra_fields(self):
+        transition_order(self.order, "cancelled", payment_method="Card")
+
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.status, order.payment_method), ("cancelled", "Card"))
+
+    def test_bulk_transition_skips_settled_orders(self):
+        paid = Order.objects.create(
+            full_name="Bo", email="bo@example.com", phone="0801", address="Abuja", status="paid",
+        )
+
+        moved = transition_orders([self.order.pk, paid.pk], "cancelled")
+
+        self.assertEqual(moved, [self.order.pk])
+        self.assertEqual(Order.objects.get(pk=paid.pk).status, "paid")
+        self.assertEqual(self.changes, [(self.order.pk, "pending", "cancelled")])
+
+
+class HotQueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command("explain_hot_queries", "--seed", "2000", stdout=out)
+
+        self.assertNotIn("SEQ SCAN", out.getvalue())
+        self.assertFalse(Order.objects.exists())
+
+    def test_detects_full_scans(self):
+        for plan, tables in [
+            ("Seq Scan on main_order  (cost=0.00..1.01 rows=1 width=8)", ["main_order"]),
+            ("2 0 0 SCAN main_order", ["main_order"]),
+            ("2 0 0 SCAN main_order USING INDEX order_created_idx", []),
+            ("Index Scan using order_created_idx on main_order", []),
+        ]:
+            found = [t for match in SEQ_SCAN.finditer(plan) for t in match.groups() if t]
+            self.assertEqual(found, tables, plan)
+
+
+class ExpirePendingOrdersTests(TestCase):
+    def test_cancels_only_stale_pending_orders(self):
+        stale, fresh, paid = [
+            Order.objects.create(
+                full_name="Ada", email="ada@example.com", phone="0800", address="Lagos", status=status,
+            )
+            for status in ["pending", "pending", "paid"]
+        ]
+        Order.objects.exclude(pk=fresh.pk).update(created_at=timezone.now() - timedelta(days=2))
+
+        call_command("expire_pending_orders", "--once", "--batch-size", "1", stdout=StringIO())
+
+        self.assertEqual(
+            dict(Order.objects.values_list("pk", "status")),
+            {stale.pk: "cancelled", fresh.pk: "pending", paid.pk: "paid"},
+        )
+
+
+@override_settings(THROTTLE_RATES={}, CONCURRENCY_LIMITS={})
+class StockReservationTests(TransactionTestCase):
+    """Checkout must never sell more than the stock, however many shoppers race"""
+
+    SHOPPERS = 20
+    STOCK = 7
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name="Flash Sale Kettle", price=5000, stock=self.STOCK)
+        self.untracked = Product.objects.create(name="Gift Card", price=1000)
+
+    def checkout(self, *lines):
+        return Client().post(
+            reverse("process_checkout"),
+            json.dumps({
+                "full_name": "Ada", "email": "ada@example.com", "phone": "0800", "address": "Lagos",
+                "items": [{"id": product.pk, "quantity": quantity} for product, quantity in lines],
+            }),
+            content_type="application/json",
+        )
+
+    def stock(self):
+        return Product.objects.get(pk=self.product.pk).stock
+
+    def test_concurrent_checkouts_never_oversell(self):
+        start = threading.Barrier(self.SHOPPERS)
+        statuses = []
+
+        def shopper():
+            try:
+                start.wait()
+                statuses.append(self.checkout((self.product, 1), (self.untracked, 1)).status_code)
+            finally:
+                connection.close()
+
+        link = {"status": "success", "data": {"link": "https://pay/abc"}}
+        with StubGateway([(200, link)]) as stub, override_settings(FLUTTERWAVE_BASE_URL=stub.url):
+            reset_client()
+            threads = [threading.Thread(target=shopper) for _ in range(self.SHOPPERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        reset_client()
+
+        sold = statuses.count(200)
+        # Every unit is either still in stock or held by exactly one order
+        reserved = Order.objects.filter(stock_reserved=True).count()
+        self.assertEqual(reserved + self.stock(), self.STOCK)
+        self.assertLessEqual(sold, reserved)
+        if connection.vendor != "sqlite":
+            # SQLite may refuse some writers with "database is locked" (a 500)
+            # instead of queueing them; servers queue on the row lock
+            self.assertEqual(sold, self.STOCK)
+            self.assertEqual(statuses.count(409), self.SHOPPERS - self.STOCK)
+
+    def test_out_of_stock_rolls_back_whole_cart(self):
+        other = Product.objects.create(name="Mug", price=1500, stock=5)
+
+        response = self.checkout((other, 2), (self.product, self.STOCK + 1))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["out_of_stock"], [self.product.pk])
+        self.assertEqual(Product.objects.get(pk=other.pk).stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_cancel_releases_stock_once(self):
+        link = {"status": "success", "data": {"link": "https://pay/abc"}}
+        with StubGateway([(200, link)]) as stub, override_settings(FLUTTERWAVE_BASE_URL=stub.url):
+            reset_client()
+            order_id = self.checkout((self.product, 3)).json()["order_id"]
+        reset_client()
+        self.assertEqual(self.stock(), self.STOCK - 3)
+
+        order = Order.objects.get(pk=order_id)
+        self.assertTrue(transition_order(order, "cancelled"))
+        self.assertFalse(release_stock(order_id))
+
+        self.assertEqual(self.stock(), self.STOCK)
+
+
+class CheckoutQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=100 + i, stock=50 if i % 2 else None)
+            for i in range(10)
+        ]
+
+    def checkout(self, count):
+        with mock.patch("main.views.create_flutterwave_payment_link", return_value="https://pay/abc"):
+            response = self.client.post(
+                reverse("process_checkout"),
+                json.dumps({
+                    "full_name": "Ada", "email": "ada@example.com", "phone": "0800", "address": "Lagos",
+                    "items": [{"id": product.pk, "quantity": 2} for product in self.products[:count]],
+                }),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        for count in (2, 5, 10):
+            # Products in bulk, the savepoint, the stock reservation (with its
+            # check for sold-out rows), the order, its items in bulk, and the
+            # savepoint release
+            with self.subTest(items=count), self.assertNumQueries(7):
+                self.checkout(count)
+
+        order = Order.objects.latest("pk")
+        self.assertEqual((order.item_count, order.items.count()), (20, 10))
+
+
+class OrderTotalsTests(TestCase):
+    def test_totals_follow_item_saves_and_deletes(self):
+        lamp = Product.objects.create(name="Lamp", price=1500)
+        rug = Product.objects.create(name="Rug", price=4000)
+        order = Order.objects.create(full_name="Ada", email="ada@example.com", phone="0800", address="Lagos")
+
+        def totals():
+            order.refresh_from_db()
+            return order.total_amount, order.item_count
+
+        lamps = OrderItem.objects.create(order=order, product=lamp, quantity=2, price=1500)
+        self.assertEqual(totals(), (Decimal("3000.00"), 2))
+        OrderItem.objects.create(order=order, product=rug, quantity=1, price=4000)
+        self.assertEqual(totals(), (Decimal("7000.00"), 3))
+
+        lamps.quantity = 3
+        lamps.save()
+        self.assertEqual(totals(), (Decimal("8500.00"), 4))
+        self.assertEqual(order.get_total_amount(), Decimal("8500.00"))
+
+        lamps.delete()
+        self.assertEqual(totals(), (Decimal("4000.00"), 1))
+        order.items.get().delete()
+        self.assertEqual(totals(), (0, 0))
+
+
+class IdempotentCheckoutTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Kettle", price=5000, stock=10)
+        self.body = json.dumps({
+            "full_name": "Ada", "email": "ada@example.com", "phone": "0800", "address": "Lagos",
+            "items": [{"id": self.product.pk, "quantity": 1}],
+        })
+
+    def checkout(self, body=None, key="retry-me"):
+        return self.client.post(
+            reverse("process_checkout"), body or self.body,
+            content_type="application/json", headers={"Idempotency-Key": key},
+        )
+
+    def test_replay_returns_first_response(self):
+        link = {"status": "success", "data": {"link": "https://pay/abc"}}
+        with StubGateway([(200, link)]) as stub, override_settings(FLUTTERWAVE_BASE_URL=stub.url):
+            reset_client()
+            first = self.checkout()
+            with CaptureQueriesContext(connection) as queries:
+                replay = self.checkout()
+        reset_client()
+
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 9)
+        self.assertFalse(any("main_product" in query["sql"] for query in queries))
+
+    def test_key_reused_for_different_request(self):
+        self.checkout(json.dumps({"items": []}))
+
+        self.assertEqual(self.checkout().status_code, 422)
+
+    def test_server_errors_are_not_stored(self):
+        with StubGateway([(500, {})]) as stub, override_settings(FLUTTERWAVE_BASE_URL=stub.url):
+            reset_client()
+            self.assertEqual(self.checkout().status_code, 500)
+        reset_client()
+
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 10)
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def webhook(self, ip):
+        return self.client.post(
+            reverse("payment_webhook"), "{}", content_type="application/json", REMOTE_ADDR=ip,
+            HTTP_VERIF_HASH="s3cret",
+        )
+
+    @override_settings(THROTTLE_RATES={"payment_webhook": "3/m"}, FLUTTERWAVE_SECRET_HASH="s3cret")
+    def test_token_bucket_per_client(self):
+        statuses = [self.webhook("10.0.0.1").status_code for _ in range(4)]
+
+        self.assertEqual(statuses[:3], [200, 200, 200])
+        self.assertEqual(statuses[3], 429)
+        self.assertEqual(self.webhook("10.0.0.1")["Retry-After"], "20")
+        # Another client has its own bucket
+        self.assertEqual(self.webhook("10.0.0.2").status_code, 200)
+
+    def test_released_slots_never_push_the_counter_below_zero(self):
+        slots = ConcurrencyLimit("gateway", 2)
+        self.assertTrue(slots.acquire())
+        # The counter expires while that slot is held, and restarts
+        cache.delete(slots.key)
+        self.assertTrue(slots.acquire())
+        slots.release()
+        slots.release()
+        self.assertEqual(cache.get(slots.key), 0)
+
+        self.assertTrue(slots.acquire())
+        self.assertTrue(slots.acquire())
+        self.assertFalse(slots.acquire())
+
+    @override_settings(CONCURRENCY_LIMITS={"gateway": 2})
+    def test_sheds_checkouts_over_gateway_limit(self):
+        busy = ConcurrencyLimit("gateway", 2)
+        self.assertTrue(busy.acquire())
+        self.assertTrue(busy.acquire())
+
+        response = self.client.post(reverse("process_checkout"), "{}", content_type="application/json")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        busy.release()
+        response = self.client.post(reverse("process_checkout"), "{}", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class StorefrontFirstPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(13):
+            Product.objects.create(name=f"Lamp {i}", price=1000 + i)
+
+    def test_first_page_is_embedded_and_shared_with_feed(self):
+        response = self.client.get(reverse("products"))
+
+        feed = response.context["initial_feed"]
+        self.assertEqual([p["name"] for p in feed["results"]][:2], ["Lamp 12", "Lamp 11"])
+        self.assertTrue(feed["has_next"])
+        self.assertContains(response, 'id="initial-feed"')
+
+        # The first infinite-scroll fetch is the same cache entry
+        with self.assertNumQueries(0):
+            data = self.client.get(reverse("products"), {"page": 1, "cursor": "", "q": ""}).json()
+        self.assertEqual(data, feed)
+
+        next_page = self.client.get(reverse("products"), {"page": 2, "cursor": feed["next_cursor"]}).json()
+        self.assertEqual([p["name"] for p in next_page["results"]], ["Lamp 0"])
+
+
+class KeysetFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        products = [Product.objects.create(name=f"Product {i}", price=100 + i) for i in range(27)]
+        # Batches sharing one created_at, so pages have to break ties on id
+        now = timezone.now()
+        for i, product in enumerate(products):
+            Product.objects.filter(pk=product.pk).update(created_at=now - timedelta(minutes=i // 5))
+        self.expected = list(Product.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def page(self, cursor):
+        return self.client.get(reverse("products"), {"page": 1, "cursor": cursor})
+
+    def test_cursor_walks_every_product_once_in_order(self):
+        seen, sizes, cursor = [], [], ""
+        while True:
+            data = self.page(cursor).json()
+            seen += [product["id"] for product in data["results"]]
+            sizes.append(len(data["results"]))
+            if not data["has_next"]:
+                break
+            cursor = data["next_cursor"]
+
+        self.assertEqual(sizes, [12, 12, 3])
+        self.assertEqual(seen, self.expected)
+        # The last page says so, and has nowhere to go next
+        self.assertIsNone(data["next_cursor"])
+
+    def test_invalid_cursor_is_a_400(self):
+        for cursor in (
+            "not-a-cursor",
+            "eHx5",                          # "x|y"
+            "b2Zmc2V0fDEy",                  # an offset cursor
+            "MjAyNi0wMS0wMVQwMDowMDowMHw1",  # a naive timestamp
+        ):
+            response = self.page(cursor)
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {"error": "Invalid cursor"})
+
+    def test_cursorless_requests_only_get_the_first_page(self):
+        # Old ?page=N links: page 1 is the keyset first page, from the same cache entry
+        data = self.client.get(reverse("products"), {"page": 1}).json()
+        self.assertEqual(data, self.page("").json())
+        self.assertEqual([product["id"] for product in data["results"]], self.expected[:12])
+
+        response = self.client.get(reverse("products"), {"page": 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.json()["error"])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def feed_names(self):
+        results = self.client.get(reverse("products"), {"page": 1, "cursor": ""}).json()["results"]
+        return [product["name"] for product in results]
+
+    def test_product_changes_invalidate_the_feed_on_commit(self):
+        Product.objects.create(name="Lamp", price=1000)
+        self.assertEqual(self.feed_names(), ["Lamp"])
+        version = get_catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Rug", price=4000)
+            # Not yet: a cache miss now would store rows from before the commit
+            self.assertEqual(get_catalog_version(), version)
+
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertEqual(self.feed_names(), ["Rug", "Lamp"])
+
+    def test_products_are_loaded_without_the_search_vector(self):
+        product = Product.objects.create(name="Lamp", price=1000)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(reverse("product_detail", args=[product.slug])), "Lamp")
+        self.assertNotIn("search_vector", " ".join(query["sql"] for query in queries))
+        self.assertEqual(Product.objects.get().get_deferred_fields(), {"search_vector"})
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        params.setdefault("page", 1)
+        response = self.client.get(reverse("products"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, query):
+        return [product["name"] for product in self.search(query)["results"]]
+
+    def test_name_matches_rank_above_description_matches(self):
+        Product.objects.create(name="Brass stand", price=100, description="Fits any lamp shade")
+        Product.objects.create(name="Lamp", price=200, description="A reading light")
+        Product.objects.create(name="Rug", price=300)
+
+        self.assertEqual(self.names("lamp"), ["Lamp", "Brass stand"])
+        # Prefixes match as the shopper types
+        self.assertEqual(self.names("lam"), ["Lamp", "Brass stand"])
+
+    def test_punctuation_only_query_is_an_empty_page(self):
+        Product.objects.create(name="Lamp", price=200)
+
+        data = self.search("!!! ...")
+        self.assertEqual((data["results"], data["has_next"]), ([], False))
+
+    def test_ranked_results_page_by_offset_cursor(self):
+        for i in range(15):
+            Product.objects.create(name=f"Lamp {i}", price=100 + i)
+        Product.objects.create(name="Rug", price=300)
+
+        seen, cursor = [], ""
+        while cursor is not None:
+            data = self.search("lamp", cursor=cursor)
+            seen += [product["id"] for product in data["results"]]
+            cursor = data["next_cursor"]
+
+        self.assertEqual(len(seen), 15)
+        self.assertEqual(len(set(seen)), 15)
+
+    def test_falls_back_to_icontains_without_fts5(self):
+        Product.objects.create(name="Lamp", price=200)
+        Product.objects.create(name="Rug", price=300)
+
+        with mock.patch(
+            "main.utils.search._search_sqlite", side_effect=DatabaseError("no such module: fts5"),
+        ):
+            # A substring, which the prefix search wouldn't match
+            self.assertEqual(self.names("amp"), ["Lamp"])
+
+
+class CompactFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_truncates_descriptions_and_builds_image_urls(self):
+        Product.objects.create(
+            name="Lamp", price=1000, description="x" * 200, image="products/brass lamp.jpg",
+        )
+
+        product = self.client.get(reverse("products"), {"page": 1, "cursor": ""}).json()["results"][0]
+
+        self.assertEqual(product["description"], "x" * 60 + "...")
+        self.assertEqual(product["image"], "/media/products/brass%20lamp.jpg")
+
+    @override_settings(USE_CLOUDINARY=True, MEDIA_URL="https://res.cloudinary.com/demo/")
+    def test_cloudinary_urls_match_the_field(self):
+        for value, url in [
+            ("image/upload/v1712/products/abc.jpg", "image/upload/v1712/products/abc.jpg"),
+            ("static/example3.jpg", "image/upload/v1/static/example3.jpg"),
+            ("abc.png", "image/upload/abc.png"),
+        ]:
+            self.assertEqual(image_url(value), "https://res.cloudinary.com/demo/" + url)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, size):
+        from PIL import Image
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "PNG")
+        return SimpleUploadedFile("lamp.png", buffer.getvalue(), content_type="image/png")
+
+    def test_builds_webp_and_jpeg_widths_without_upscaling(self):
+        product = Product.objects.create(name="Lamp", price=1000, image=self.upload((600, 300)))
+
+        self.assertTrue(build_product_variants(product.pk))
+
+        product.refresh_from_db()
+        self.assertEqual(sorted(product.image_variants["webp"], key=int), ["200", "400", "600"])
+        self.assertEqual(sorted(product.image_variants["jpeg"], key=int), ["200", "400", "600"])
+        self.assertTrue(product.image_variants["webp"]["200"].endswith("variants/lamp-200.webp"))
+
+        feed = self.client.get(reverse("products"), {"page": 1, "cursor": ""}).json()["results"][0]
+        self.assertEqual(feed["image"], "/media/products/variants/lamp-600.jpg")
+        self.assertIn("/media/products/variants/lamp-200.webp 200w", feed["srcset"])
+
+    def test_replacing_the_image_deletes_the_old_variants(self):
+        from django.core.files.storage import default_storage
+
+        product = Product.objects.create(name="Lamp", price=1000, image=self.upload((300, 300)))
+        build_product_variants(product.pk)
+        product.refresh_from_db()
+        old_variants = product.image_variants
+
+        # As the product form does: clear the variants and rebuild after the save
+        product.image = self.upload((500, 500))
+        product.image_variants = {}
+        product.save()
+        self.assertTrue(build_product_variants(product.pk, previous=old_variants))
+
+        product.refresh_from_db()
+        self.assertEqual(sorted(product.image_variants["webp"], key=int), ["200", "400", "500"])
+        for widths in old_variants.values():
+            for path in widths.values():
+                self.assertFalse(default_storage.exists(path), path)
+
+    def test_replaced_image_keeps_its_own_variants(self):
+        from django.core.files.storage import default_storage
+
+        from .utils import images
+
+        product = Product.objects.create(name="Lamp", price=1000, image=self.upload((300, 300)))
+        generate = images.generate_variants
+
+        def replaced_meanwhile(name):
+            variants = generate(name)
+            Product.objects.filter(pk=product.pk).update(image="products/other.png")
+            return variants
+
+        with mock.patch.object(images, "generate_variants", replaced_meanwhile):
+            self.assertFalse(build_product_variants(product.pk))
+
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+        self.assertFalse(default_storage.exists("products/variants/lamp-300.webp"))
+
+
+class ProductImportTests(TestCase):
+    def import_file(self, content, file_format="csv", **kwargs):
+        return import_products(read_records(BytesIO(content.encode()), file_format), **kwargs)
+
+    def test_creates_updates_and_suffixes_slugs(self):
+        lamp = Product.objects.create(name="Lamp", price=1000, stock=3)
+
+        report = self.import_file(
+            "slug,name,price,stock\n"
+            "lamp,,1200,\n"        # update; blank name kept, blank stock untracked
+            ",Lamp,900,5\n"        # new product, "lamp" is taken
+            ",Lamp,800,\n"
+            "rug!,Rug,4000,2\n",
+            chunk_size=2,
+        )
+
+        self.assertEqual([line for line, _ in report["errors"]], [5])
+        self.assertEqual((report["created"], report["updated"]), (2, 1))
+        self.assertEqual(
+            set(Product.objects.values_list("name", "slug", "price", "stock")),
+            {("Lamp", "lamp", 1200, None), ("Lamp", "lamp-2", 900, 5), ("Lamp", "lamp-3", 800, None)},
+        )
+
+        report = self.import_file(
+            '{"slug": "lamp", "price": "1250.50", "stock": 3}\n'
+            '{"slug": "lamp", "stock": 9}\n'
+            'not json\n'
+            '{"slug": "desk", "name": "Desk"}\n',
+            "jsonl",
+        )
+
+        self.assertEqual(report["updated"], 1)
+        self.assertEqual([line for line, _ in report["errors"]], [2, 3, 4])
+        lamp.refresh_from_db()
+        # Only the columns the row had are written
+        self.assertEqual((lamp.name, lamp.price, lamp.stock), ("Lamp", Decimal("1250.50"), 3))
+
+    def test_slugs_taken_during_the_import_are_not_overwritten(self):
+        def records():
+            # Another writer takes these slugs after the import loaded the ones in use
+            Product.objects.create(name="Lamp", price=1000, slug="lamp")
+            Product.objects.create(name="Desk", price=2000, slug="desk")
+            yield 2, {"name": "Lamp", "price": "900"}
+            yield 3, {"name": "Office desk", "slug": "desk", "price": "500"}
+            yield 4, {"name": "Rug", "price": "300"}
+
+        report = import_products(records())
+
+        self.assertEqual((report["created"], [line for line, _ in report["errors"]]), (2, [3]))
+        self.assertEqual(
+            set(Product.objects.values_list("name", "slug", "price")),
+            {("Lamp", "lamp", 1000), ("Desk", "desk", 2000), ("Lamp", "lamp-2", 900), ("Rug", "rug", 300)},
+        )
+
+    def test_dry_run_writes_nothing(self):
+        report = self.import_file("name,price\nLamp,100\nRug,abc\n", dry_run=True)
+
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(len(report["errors"]), 1)
+        self.assertFalse(Product.objects.exists())
+
+    def test_save_suffixes_a_taken_slug(self):
+        Product.objects.create(name="Lamp", price=1000)
+        self.assertEqual(Product.objects.create(name="Lamp", price=900).slug, "lamp-2")
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.lamp = Product.objects.create(name="Lamp", price=1500)
+        self.rug = Product.objects.create(name="Rug", price=4000)
+
+    def order(self, *items):
+        order = Order.objects.create(full_name="Ada", email="ada@example.com", phone="0800", address="Lagos")
+        for product, quantity in items:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        order.refresh_from_db()
+        return order
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.values_list("date", "orders", "units", "revenue", "cancelled_orders")),
+            sorted(DailyProductSales.objects.values_list("date", "product_id", "units", "revenue")),
+        )
+
+    def test_status_changes_update_the_day(self):
+        today = timezone.localdate()
+        first = self.order((self.lamp, 2), (self.rug, 1))
+        second = self.order((self.lamp, 1))
+        transition_order(first, "paid")
+        transition_order(first, "shipped")  # still sold, no change
+        transition_order(second, "paid")
+        transition_orders([self.order((self.rug, 1)).pk], "cancelled")
+
+        self.assertEqual(self.rollups(), (
+            [(today, 2, 4, Decimal("8500.00"), 1)],
+            [(today, self.lamp.pk, 3, Decimal("4500.00")), (today, self.rug.pk, 1, Decimal("4000.00"))],
+        ))
+
+        # A paid order reopened in the Django admin stops counting
+        second.status = "pending"
+        second.save()
+        self.assertEqual(DailySales.objects.get().orders, 1)
+        self.assertEqual(DailyProductSales.objects.get(product=self.lamp).units, 2)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for items in [((self.lamp, 2),), ((self.rug, 1), (self.lamp, 1))]:
+            transition_order(self.order(*items), "paid")
+        transition_order(self.order((self.rug, 3)), "cancelled")
+        self.order((self.rug, 1))  # pending, not counted
+        incremental = self.rollups()
+
+        self.assertEqual(rebuild_sales_rollups(), (1, 2))
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_rebuild_counts_archived_orders(self):
+        order = self.order((self.lamp, 2))
+        transition_order(order, "paid")
+        transition_order(order, "shipped")
+        transition_order(order, "completed")
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=400))
+        call_command("archive_orders", "--once", stdout=StringIO())
+        self.assertFalse(Order.objects.exists())
+
+        out = StringIO()
+        call_command("rebuild_sales_rollups", stdout=out)
+
+        day = timezone.localdate() - timedelta(days=400)
+        self.assertEqual(self.rollups()[0], [(day, 1, 2, Decimal("3000.00"), 0)])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_histograms_render_cumulative_buckets(self):
+        metrics = MetricsRegistry({"latency_seconds": ("histogram", "Latency", (0.1, 1.0))})
+        for value in (0.05, 0.5, 3):
+            metrics.observe("latency_seconds", value, view='say "hi"')
+
+        self.assertEqual(metrics.render().splitlines()[2:], [
+            'latency_seconds_bucket{view="say \\"hi\\"",le="0.1"} 1',
+            'latency_seconds_bucket{view="say \\"hi\\"",le="1.0"} 2',
+            'latency_seconds_bucket{view="say \\"hi\\"",le="+Inf"} 3',
+            'latency_seconds_sum{view="say \\"hi\\""} 3.55',
+            'latency_seconds_count{view="say \\"hi\\""} 3',
+        ])
+
+    def test_middleware_records_views_and_queries(self):
+        Product.objects.create(name="Lamp", price=1000)
+        self.client.get(reverse("products"))
+
+        rendered = registry.render()
+        self.assertIn('http_requests_total{method="GET",status="200",view="products"} 1', rendered)
+        self.assertIn('db_queries_per_request_count{view="products"} 1', rendered)
+        self.assertIn('http_response_size_bytes_count{view="products"} 1', rendered)
+
+    def test_unnamed_routes_are_labelled_by_view_path(self):
+        from django.urls import ResolverMatch
+
+        from .middleware import view_label
+        from .views import products
+
+        self.assertEqual(view_label(ResolverMatch(products, (), {}, url_name="products")), "products")
+        self.assertEqual(view_label(ResolverMatch(products, (), {})), "main.views.products")
+        self.assertEqual(view_label(None), "unmatched")
+
+    def test_sampled_requests_log_slow_queries(self):
+        from .utils import metrics
+
+        set_slow_query_sampling(rate=1, threshold_ms=0, duration=60)
+        self.addCleanup(clear_slow_query_sampling)
+        # This process caches the flag too; forget it so later tests don't sample
+        self.addCleanup(metrics._sampling.update, checked_at=0.0, value=None)
+        metrics._sampling["checked_at"] = 0  # don't wait for the next check
+
+        with self.assertLogs("main.slow_queries", "WARNING") as logs:
+            self.client.get(reverse("products"))
+        self.assertIn("in products:", logs.output[0])
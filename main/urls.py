@@ -8,5 +8,6 @@ urlpatterns = [
     path('checkout/', checkout_view, name='checkout'),
     path('checkout/process/', process_checkout, name='process_checkout'),
     path('payment/callback/', payment_callback, name='payment_callback'),
+    path('payment/status/<str:tx_ref>/', payment_status, name='payment_status'),
     path('payment/webhook/', payment_webhook, name='payment_webhook'),
 ]
@@ -0,0 +1,51 @@
+from django.db import transaction
+from main.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# Orders in these statuses will never change again
+ARCHIVABLE_STATUSES = ("completed", "cancelled")
+
+ORDER_FIELDS = [
+    "id", "full_name", "email", "phone", "address", "status",
+    "transaction_ref", "flutterwave_transaction_id", "payment_method",
+    "total_amount", "item_count", "created_at", "updated_at",
+]
+
+
+def archive_orders(before, batch_size=500):
+    """
+    Move one chunk of settled orders created before `before`, with their
+    items, into the archive tables in one transaction. Returns how many
+    orders moved.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=before)
+            .order_by("created_at")
+            .values(*ORDER_FIELDS)[:batch_size]
+        )
+        if not orders:
+            return 0
+        order_ids = [order["id"] for order in orders]
+
+        items = (
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .values("order_id", "product_id", "product__name", "quantity", "price")
+        )
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(
+                order_id=item["order_id"],
+                product_id=item["product_id"],
+                product_name=item["product__name"],
+                quantity=item["quantity"],
+                price=item["price"],
+            )
+            for item in items
+        ])
+
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        # Goes through the ORM delete so post_delete keeps the stats cache right
+        Order.objects.filter(pk__in=order_ids).delete()
+
+    return len(order_ids)
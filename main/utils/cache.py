@@ -0,0 +1,55 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def _new_version():
+    # Seed from the clock rather than 1, so a version key that got evicted can
+    # never come back as a number that still has entries cached under it
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version, creating it if the cache lost it
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog entry at once by moving to a new version
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, _new_version(), timeout=None)
+
+
+def catalog_key(*parts):
+    """
+    Build a cache key for catalog data under the current catalog version
+    """
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f"catalog:{get_catalog_version()}:{digest}"
+
+
+def cached_catalog(parts, compute):
+    """
+    Return the cached value for `parts`, computing and storing it on a miss.
+    `compute` may return None to signal "don't cache" (e.g. a 404).
+    """
+    key = catalog_key(*parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        if value is not None:
+            cache.set(key, value, getattr(settings, "CATALOG_CACHE_TIMEOUT", 3600))
+    return value
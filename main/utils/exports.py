@@ -0,0 +1,149 @@
+import csv
+import datetime
+from decimal import Decimal
+
+from django.db.models import F
+from django.utils import timezone
+
+from main.utils.feed import dumps
+
+# One row per order item, with its order's columns repeated
+EXPORT_COLUMNS = [
+    "order_id", "created_at", "status", "full_name", "email", "phone", "address",
+    "transaction_ref", "flutterwave_transaction_id", "payment_method", "order_total",
+    "item_id", "product_id", "product_name", "product_slug", "quantity", "unit_price",
+    "line_total",
+]
+
+# Rows fetched per round trip; on PostgreSQL .iterator() reads them through a
+# server-side cursor, so memory stays flat however many orders match
+CHUNK_SIZE = 2000
+
+# Rows joined into each chunk of the response body
+ROWS_PER_WRITE = 500
+
+
+class ExportError(ValueError):
+    """An export filter could not be understood"""
+
+
+def parse_day(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"{name} must be a date (YYYY-MM-DD), got {value!r}")
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def export_rows(statuses=(), since=None, until=None, archived=False):
+    """
+    Return an iterator of export rows (tuples in EXPORT_COLUMNS order) for
+    the items of orders created between `since` and `until` (dates, both
+    inclusive), optionally limited to some statuses. `archived` reads the archive tables instead.
+    """
+    from main.models import ArchivedOrderItem, Order, OrderItem
+
+    unknown = set(statuses) - {value for value, _ in Order.STATUS_CHOICES}
+    if unknown:
+        raise ExportError(f"Unknown status: {', '.join(sorted(unknown))}")
+
+    items = ArchivedOrderItem.objects if archived else OrderItem.objects
+    if statuses:
+        items = items.filter(order__status__in=statuses)
+    # Whole-day bounds on the raw column, so the created_at indexes apply
+    if since:
+        items = items.filter(order__created_at__gte=day_start(since))
+    if until:
+        items = items.filter(order__created_at__lt=day_start(until + datetime.timedelta(days=1)))
+
+    product_name = F("product_name") if archived else F("product__name")
+    rows = (
+        items.annotate(export_product_name=product_name)
+        .order_by("order_id", "id")
+        .values_list(
+            "order_id", "order__created_at", "order__status", "order__full_name",
+            "order__email", "order__phone", "order__address", "order__transaction_ref",
+            "order__flutterwave_transaction_id", "order__payment_method",
+            "order__total_amount", "id", "product_id", "export_product_name",
+            "product__slug", "quantity", "price",
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    # Filters are checked above, before the caller starts streaming
+    return (row + (row[-1] * row[-2],) for row in rows)
+
+
+def _json_value(value):
+    # Decimals as exact strings, timestamps in the same form as the CSV
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+# Spreadsheets run cells starting with these as formulas ("=HYPERLINK(...)")
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        # Customer-typed text is quoted so it can't turn into a formula
+        return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+    return str(_json_value(value))
+
+
+class _Line:
+    """File-like target for csv.writer that hands back what was written"""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= ROWS_PER_WRITE:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+
+
+def stream_csv(rows):
+    """Encode export rows as CSV with a header, in bytes chunks"""
+    writer = csv.writer(_Line())
+
+    def lines():
+        yield writer.writerow(EXPORT_COLUMNS).encode()
+        for row in rows:
+            yield writer.writerow([_text(value) for value in row]).encode()
+
+    return _chunked(lines())
+
+
+def stream_jsonl(rows):
+    """Encode export rows as one JSON object per line, in bytes chunks"""
+    def lines():
+        for row in rows:
+            record = {
+                column: _json_value(value) for column, value in zip(EXPORT_COLUMNS, row)
+            }
+            yield dumps(record) + b"\n"
+
+    return _chunked(lines())
+
+
+EXPORT_FORMATS = {
+    # format: (encoder, content type)
+    "csv": (stream_csv, "text/csv; charset=utf-8"),
+    "jsonl": (stream_jsonl, "application/x-ndjson"),
+}
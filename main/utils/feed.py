@@ -0,0 +1,63 @@
+import json
+import re
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.encoding import filepath_to_uri
+
+try:
+    import orjson
+except ImportError:  # optional, several times faster than the json module
+    orjson = None
+
+# products.html shows this much of each description in the grid
+DESCRIPTION_LENGTH = 60
+
+# How CloudinaryField stores a resource: "[image/upload/][v123/]public_id[.jpg]"
+CLOUDINARY_VALUE_RE = re.compile(
+    r"(?:(?P<resource_type>image|raw|video)/(?P<type>upload|private|authenticated)/)?"
+    r"(?:v(?P<version>\d+)/)?(?P<public_id>.*?)(\.(?P<format>[^.]+))?$"
+)
+
+
+def image_url(name):
+    """
+    URL for a stored product image, from the raw column value. Builds the
+    same URL the ImageField/CloudinaryField descriptors would, without
+    creating a file or CloudinaryResource object per product.
+    """
+    if not name:
+        return ""
+    if not settings.USE_CLOUDINARY:
+        # What FileSystemStorage.url does, minus its urljoin
+        return settings.MEDIA_URL + filepath_to_uri(name).lstrip("/")
+
+    match = CLOUDINARY_VALUE_RE.match(name)
+    path = f"{match['resource_type'] or 'image'}/{match['type'] or 'upload'}/"
+    if match["version"]:
+        path += f"v{match['version']}/"
+    elif "/" in match["public_id"]:
+        # Cloudinary's default force_version: foldered ids get a "v1"
+        path += "v1/"
+    path += match["public_id"]
+    if match["format"]:
+        path += f".{match['format']}"
+    return settings.MEDIA_URL + path
+
+
+def truncate(text, length=DESCRIPTION_LENGTH):
+    if len(text) > length:
+        return text[:length] + "..."
+    return text
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+def json_response(data, status=200):
+    """JsonResponse, encoded with orjson when it is installed"""
+    return HttpResponse(dumps(data), status=status, content_type="application/json")
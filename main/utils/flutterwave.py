@@ -0,0 +1,247 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from main.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or answered with a server error"""
+
+
+class CircuitOpen(GatewayError):
+    """The gateway has been failing; calls are refused without trying"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and refuses calls
+    for `reset_timeout` seconds, then lets a single trial call through
+    (half-open) to decide whether to close again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let this call through as the trial; others wait another period
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class GatewayStats:
+    """Process-wide call counters and latency totals, per operation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, operation, seconds=None, error=False, retry=False, rejected=False):
+        with self._lock:
+            stats = self._stats.setdefault(operation, {
+                "calls": 0, "errors": 0, "retries": 0, "rejected": 0,
+                "latency_total": 0.0, "latency_max": 0.0,
+            })
+            if rejected:
+                stats["rejected"] += 1
+                registry.inc("gateway_rejected_total", operation=operation)
+                return
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += int(retry)
+            if seconds is not None:
+                stats["latency_total"] += seconds
+                stats["latency_max"] = max(stats["latency_max"], seconds)
+                registry.observe(
+                    "gateway_request_duration_seconds", seconds,
+                    operation=operation, outcome="error" if error else "ok",
+                )
+
+    def snapshot(self):
+        with self._lock:
+            return {operation: dict(stats) for operation, stats in self._stats.items()}
+
+
+class FlutterwaveClient:
+    """
+    Flutterwave API client sharing one keep-alive session per process.
+
+    Uses separate connect/read timeouts, retries idempotent calls (verify)
+    with jittered backoff and fails fast through a circuit breaker while the
+    gateway is degraded.
+    """
+
+    def __init__(self, base_url, secret_key, connect_timeout=3.05, read_timeout=10,
+                 verify_retries=2, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.verify_retries = verify_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = GatewayStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {secret_key}",
+            "Content-Type": "application/json",
+        })
+
+    def _request(self, operation, method, path, retries=0, **kwargs):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.stats.record(operation, rejected=True)
+                raise CircuitOpen(f"Flutterwave circuit open, {operation} refused")
+
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs
+                )
+                if response.status_code >= 500:
+                    raise GatewayError(f"HTTP {response.status_code}")
+            except (requests.RequestException, GatewayError) as e:
+                self.breaker.record_failure()
+                self.stats.record(
+                    operation, time.perf_counter() - start, error=True, retry=attempt > 0
+                )
+                if attempt >= retries:
+                    logger.warning("Flutterwave %s failed: %s", operation, e)
+                    raise GatewayError(str(e)) from e
+                attempt += 1
+                # Full jitter, so retries from many workers don't line up
+                time.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+                continue
+
+            self.breaker.record_success()
+            self.stats.record(operation, time.perf_counter() - start, retry=attempt > 0)
+            return response
+
+    @staticmethod
+    def _json(response):
+        """The response body as a dict; anything else (e.g. a proxy's HTML error page) is a GatewayError"""
+        try:
+            result = response.json()
+        except ValueError as e:
+            raise GatewayError(f"Invalid JSON in HTTP {response.status_code} response") from e
+        if not isinstance(result, dict):
+            raise GatewayError(f"Unexpected JSON in HTTP {response.status_code} response")
+        return result
+
+    def create_payment(self, payment_data):
+        """
+        Create a hosted payment and return its link, or None if it was refused.
+        Not retried: a repeated POST could create a second payment.
+        """
+        response = self._request("create_payment", "POST", "/payments", json=payment_data)
+        if response.status_code == 200:
+            result = self._json(response)
+            if result.get("status") == "success":
+                return result["data"]["link"]
+
+        logger.error("Flutterwave API Error: %s - %s", response.status_code, response.text)
+        return None
+
+    def _transaction_status(self, operation, path, params=None):
+        response = self._request(
+            operation, "GET", path, params=params, retries=self.verify_retries,
+        )
+        if response.status_code == 200:
+            result = self._json(response)
+            if result.get("status") == "success":
+                return (result.get("data") or {}).get("status")
+        return None
+
+    def transaction_status(self, transaction_id):
+        """
+        Return the gateway's status for a transaction ("successful", "failed",
+        "pending", ...) or None if it doesn't know the transaction
+        """
+        return self._transaction_status(
+            "verify_transaction", f"/transactions/{transaction_id}/verify"
+        )
+
+    def transaction_status_by_reference(self, tx_ref):
+        """
+        Like transaction_status, looked up by our tx_ref
+        """
+        return self._transaction_status(
+            "verify_by_reference", "/transactions/verify_by_reference", {"tx_ref": tx_ref}
+        )
+
+    def verify_transaction(self, transaction_id):
+        """
+        Return True if Flutterwave confirms the transaction as successful
+        """
+        return self.transaction_status(transaction_id) == "successful"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide Flutterwave client, building it from settings
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FlutterwaveClient(
+                    base_url=settings.FLUTTERWAVE_BASE_URL,
+                    secret_key=getattr(settings, "FLUTTERWAVE_SECRET_KEY", ""),
+                    connect_timeout=settings.FLUTTERWAVE_CONNECT_TIMEOUT,
+                    read_timeout=settings.FLUTTERWAVE_READ_TIMEOUT,
+                    verify_retries=settings.FLUTTERWAVE_VERIFY_RETRIES,
+                    pool_size=settings.FLUTTERWAVE_POOL_SIZE,
+                    breaker=CircuitBreaker(
+                        settings.FLUTTERWAVE_BREAKER_THRESHOLD,
+                        settings.FLUTTERWAVE_BREAKER_RESET,
+                    ),
+                )
+    return _client
+
+
+def reset_client():
+    """Drop the shared client so the next get_client() re-reads settings"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,136 @@
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from main.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# How long a duplicate waits for the first request before giving up with a
+# 409, and after how long an unfinished first request (a crashed worker) is
+# taken over by the next retry
+WAIT_SECONDS = 10
+STALE_SECONDS = 120
+
+
+def _stored_response(record):
+    response = HttpResponse(
+        bytes(record.response_body or b""),
+        status=record.response_status,
+        content_type=record.response_content_type or None,
+    )
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _claim(key, fingerprint):
+    """
+    Return (record, created). Two requests racing on a new key both try the
+    INSERT; the unique key lets exactly one of them win.
+    """
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(key=key, fingerprint=fingerprint), True
+    except IntegrityError:
+        return IdempotencyKey.objects.get(key=key), False
+
+
+def _wait_for(record):
+    """Poll until the in-flight request finishes, it looks dead, or we give up"""
+    deadline = time.monotonic() + WAIT_SECONDS
+    delay = 0.05
+    while record.status == "in_progress":
+        if record.started_at < timezone.now() - timedelta(seconds=STALE_SECONDS):
+            # Take over; the conditional update makes sure only one retry does
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, status="in_progress", started_at=record.started_at,
+            ).update(started_at=timezone.now())
+            return record, bool(taken)
+        if time.monotonic() >= deadline:
+            return record, False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None:
+            # The first request failed and released the key; retry the claim
+            return None, False
+    return record, False
+
+
+def idempotent(scope):
+    """
+    Make a view answer repeats of a request that carries an Idempotency-Key
+    header with the first response, without running the view again.
+
+    A duplicate that arrives while the first request is still running waits
+    for it. 5xx responses aren't stored, so the client can retry them.
+    Requests without the header run as usual.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            client_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not client_key:
+                return view(request, *args, **kwargs)
+            if len(client_key) > MAX_KEY_LENGTH:
+                return JsonResponse({"error": f"{IDEMPOTENCY_HEADER} is too long"}, status=400)
+
+            key = f"{scope}:{client_key}"
+            fingerprint = hashlib.sha256(request.body).hexdigest()
+
+            while True:
+                record, created = _claim(key, fingerprint)
+                if record.fingerprint != fingerprint:
+                    return JsonResponse(
+                        {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                        status=422,
+                    )
+                if created:
+                    break
+                record, taken = _wait_for(record)
+                if record is None:
+                    continue
+                if taken:
+                    break
+                if record.status == "completed":
+                    return _stored_response(record)
+                response = JsonResponse(
+                    {"error": "A request with this Idempotency-Key is still being processed"},
+                    status=409,
+                )
+                response["Retry-After"] = "1"
+                return response
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+                raise
+
+            if response.status_code >= 500 or getattr(response, "streaming", False):
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+            else:
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status="completed",
+                    response_status=response.status_code,
+                    response_content_type=response.get("Content-Type", ""),
+                    response_body=response.content,
+                    completed_at=timezone.now(),
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_idempotency_keys(before=None):
+    """Delete keys older than IDEMPOTENCY_KEY_TTL_HOURS. Returns how many went."""
+    if before is None:
+        before = timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(started_at__lt=before).delete()
+    return deleted
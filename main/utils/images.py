@@ -0,0 +1,134 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from main.utils.feed import image_url
+
+logger = logging.getLogger(__name__)
+
+# Widths to keep, capped at the 800px "limit" the Cloudinary field applies
+VARIANT_WIDTHS = (200, 400, 800)
+VARIANT_FORMATS = {
+    # format key: (Pillow format, extension, save options)
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Resizing is CPU-heavy; two threads keep it off the request path without
+# letting a bulk upload take over the process
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-variants")
+
+
+def variant_url(variants, fmt, smallest=False):
+    """URL of the largest (or smallest) stored width of a format, or ''"""
+    widths = variants.get(fmt) or {}
+    if not widths:
+        return ""
+    pick = min if smallest else max
+    return image_url(widths[str(pick(int(width) for width in widths))])
+
+
+def variant_srcset(variants, fmt):
+    """A srcset attribute value ("<url> 200w, <url> 400w"), or ''"""
+    widths = variants.get(fmt) or {}
+    return ", ".join(
+        f"{image_url(widths[width])} {width}w" for width in sorted(widths, key=int)
+    )
+
+
+def generate_variants(name):
+    """
+    Write resized WebP and JPEG copies of the stored image `name` next to it,
+    in a "variants" folder. Returns the image_variants mapping.
+    """
+    from PIL import Image, ImageOps
+
+    with default_storage.open(name, "rb") as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    folder, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    # Never upscale: widths past the original collapse into one at its size
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+
+    variants = {fmt: {} for fmt in VARIANT_FORMATS}
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for fmt, (pil_format, extension, options) in VARIANT_FORMATS.items():
+            frame = resized.convert("RGB") if pil_format == "JPEG" else resized
+            buffer = BytesIO()
+            frame.save(buffer, pil_format, **options)
+            path = posixpath.join(folder, "variants", f"{stem}-{width}.{extension}")
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[fmt][str(width)] = default_storage.save(path, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def _paths(variants):
+    return {path for widths in variants.values() for path in widths.values()}
+
+
+def build_product_variants(product_id, bump_catalog=True, previous=None):
+    """
+    (Re)build the variants of one product's current image and store them.
+    `previous` are the variants of the image it replaced; their files are
+    deleted along with any other copies the new variants don't reuse.
+    Returns True if the product got new variants.
+    """
+    from main.models import Product
+    from main.utils.cache import bump_catalog_version
+
+    stale = _paths(previous or {})
+    built = False
+    product = Product.objects.filter(pk=product_id).only("image", "image_variants").first()
+    if product is not None and product.image:
+        name = product.image.name
+        try:
+            variants = generate_variants(name)
+        except Exception:
+            logger.exception("Could not build image variants for product %s (%s)", product_id, name)
+        else:
+            # Only if the image wasn't replaced meanwhile; that upload builds its own
+            if Product.objects.filter(pk=product_id, image=name).update(image_variants=variants):
+                built = True
+                stale = (stale | _paths(product.image_variants)) - _paths(variants)
+            else:
+                stale |= _paths(variants)
+
+    for path in stale:
+        default_storage.delete(path)
+    if built and bump_catalog:
+        bump_catalog_version()
+    return built
+
+
+def _build_in_background(product_id, previous):
+    try:
+        build_product_variants(product_id, previous=previous)
+    finally:
+        # This thread's connection isn't managed by a request cycle
+        connection.close()
+
+
+def schedule_product_variants(product_id, previous=None):
+    """
+    Build a product's variants on a background thread once the current
+    transaction commits, deleting the `previous` image's ones. No-op with
+    Cloudinary, which resizes on delivery.
+    """
+    if settings.USE_CLOUDINARY:
+        return
+    transaction.on_commit(lambda: _executor.submit(_build_in_background, product_id, previous))
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Sum, Value, When
+from main.models import Order, OrderItem, Product
+from main.utils.cache import bump_catalog_version
+
+
+class OutOfStock(Exception):
+    """Some products in the cart don't have enough stock left"""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Not enough stock for products {product_ids}")
+        self.product_ids = product_ids
+
+
+def _per_product(quantities):
+    """CASE id WHEN ... THEN quantity END, to update every product in one statement"""
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
+
+
+def _sold_out_changed(product_ids):
+    # Pages show whether a product is sold out, so refresh the catalog cache
+    # when one sells out or comes back; other stock changes don't need it
+    if Product.objects.filter(pk__in=product_ids, stock=0).exists():
+        transaction.on_commit(bump_catalog_version)
+
+
+def reserve_stock(quantities):
+    """
+    Take stock for a cart, given {product_id: quantity} for the tracked
+    products in it, with one UPDATE ... SET stock = stock - q WHERE stock >= q.
+
+    Must run inside the checkout transaction: raises OutOfStock if any product
+    is short, and the caller's rollback undoes the rows that were updated.
+    Row locks are held only until that (short) transaction commits, and a
+    concurrent checkout re-checks stock >= q once it gets the row.
+    """
+    if not quantities:
+        return False
+
+    needed = _per_product(quantities)
+    updated = Product.objects.filter(
+        pk__in=quantities, stock__isnull=False, stock__gte=needed,
+    ).update(stock=F("stock") - needed)
+
+    if updated != len(quantities):
+        stock = dict(Product.objects.filter(pk__in=quantities).values_list("pk", "stock"))
+        short = sorted(
+            product_id for product_id, quantity in quantities.items()
+            if stock.get(product_id) is None or stock[product_id] < quantity
+        )
+        raise OutOfStock(short)
+
+    _sold_out_changed(quantities)
+    return True
+
+
+def release_stock(order_id):
+    """
+    Put back the stock an order reserved at checkout. Safe to call any
+    number of times: only the call that clears stock_reserved restocks.
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order_id, stock_reserved=True).update(stock_reserved=False):
+            return False
+
+        quantities = dict(
+            OrderItem.objects.filter(order_id=order_id, product__stock__isnull=False)
+            .values("product_id")
+            .annotate(quantity=Sum("quantity"))
+            .values_list("product_id", "quantity")
+        )
+        if quantities:
+            _sold_out_changed(quantities)
+            Product.objects.filter(pk__in=quantities, stock__isnull=False).update(
+                stock=F("stock") + _per_product(quantities)
+            )
+    return True
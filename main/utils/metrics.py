@@ -0,0 +1,189 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+slow_query_logger = logging.getLogger("main.slow_queries")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram", "Time spent handling a request, by view", LATENCY_BUCKETS,
+    ),
+    "http_response_size_bytes": (
+        "histogram", "Size of non-streaming response bodies, by view", SIZE_BUCKETS,
+    ),
+    "http_requests_total": ("counter", "Requests handled, by view and status", None),
+    "db_queries_per_request": (
+        "histogram", "Database queries run while handling a request, by view", COUNT_BUCKETS,
+    ),
+    "db_query_duration_seconds": (
+        "histogram", "Time spent in database queries per request, by view", LATENCY_BUCKETS,
+    ),
+    "gateway_request_duration_seconds": (
+        "histogram", "Flutterwave API call latency, by operation and outcome", LATENCY_BUCKETS,
+    ),
+    "gateway_rejected_total": (
+        "counter", "Flutterwave calls refused by the open circuit breaker", None,
+    ),
+    "notification_delivery_duration_seconds": (
+        "histogram", "Notify.Events delivery latency, by outcome", LATENCY_BUCKETS,
+    ),
+    "slow_queries_total": ("counter", "Sampled queries over the slow query threshold", None),
+}
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms aggregated in this process, rendered in the
+    Prometheus text format. Each worker process keeps its own figures.
+    """
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # name -> {label items: [bucket counts..., +Inf, sum, count]} or {label items: value}
+        self._values = {name: {} for name in metrics}
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = self.metrics[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name].get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum and the count
+                series = self._values[name][key] = [0] * (len(buckets) + 3)
+            # Counts per bucket here; render() makes them cumulative
+            series[bisect.bisect_left(buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._values = {name: {} for name in self.metrics}
+
+    def render(self):
+        with self._lock:
+            # Copy the histogram lists too; observe() keeps changing them
+            values = {
+                name: {key: list(value) if isinstance(value, list) else value for key, value in series.items()}
+                for name, series in self._values.items()
+            }
+
+        lines = []
+        for name, (kind, help_text, buckets) in self.metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(values[name].items()):
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(key)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, "+Inf"), value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(key + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(items):
+    if not items:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in items
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe how long the block takes; outcome="error" if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.observe(name, time.perf_counter() - start, outcome="error", **labels)
+        raise
+    registry.observe(name, time.perf_counter() - start, outcome="ok", **labels)
+
+
+# Slow query sampling is switched on through the cache, so every worker picks
+# it up without a redeploy (manage.py slow_query_sampling)
+SLOW_QUERY_SAMPLING_KEY = "metrics:slow_query_sampling"
+# How long a worker reuses the flag before reading the cache again
+SAMPLING_CHECK_SECONDS = 5
+
+_sampling = {"checked_at": 0.0, "value": None}
+
+
+def set_slow_query_sampling(rate, threshold_ms, duration):
+    """Log queries slower than threshold_ms for `rate` of requests, for `duration` seconds"""
+    cache.set(SLOW_QUERY_SAMPLING_KEY, {"rate": rate, "threshold_ms": threshold_ms}, duration)
+
+
+def clear_slow_query_sampling():
+    cache.delete(SLOW_QUERY_SAMPLING_KEY)
+
+
+def slow_query_threshold():
+    """
+    The slow query threshold in seconds if this request is sampled, else None
+    """
+    now = time.monotonic()
+    if now - _sampling["checked_at"] >= SAMPLING_CHECK_SECONDS:
+        _sampling["value"] = cache.get(SLOW_QUERY_SAMPLING_KEY)
+        _sampling["checked_at"] = now
+    sampling = _sampling["value"]
+    if not sampling or random.random() >= sampling["rate"]:
+        return None
+    return sampling["threshold_ms"] / 1000
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper hook counting a request's queries and their
+    time, logging the slow ones when the request is sampled
+    """
+
+    def __init__(self, slow_threshold=None):
+        self.slow_threshold = slow_threshold
+        self.count = 0
+        self.seconds = 0.0
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+                registry.inc("slow_queries_total")
+                slow_query_logger.warning(
+                    "Slow query (%.1f ms) in %s: %s", elapsed * 1000, self.view or "-", sql,
+                )
@@ -1,11 +1,31 @@
+import logging
+import random
+from datetime import timedelta
+
 import requests
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from main.utils.metrics import timed
+
+logger = logging.getLogger(__name__)
 
 NOTIFY_EVENTS_URL = "https://notify.events/api/v1/channel/source/{}/execute"
 
-def send_notify_event(message, title="🚨 Django Alert"):
+# Retry schedule for the outbox worker: 30s, 1m, 2m, ... capped at an hour
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+MAX_ATTEMPTS = 8
+
+# How long a worker owns a claimed batch before another worker may retry it
+CLAIM_SECONDS = 5 * 60
+
+
+def deliver_notify_event(message, title="🚨 Django Alert"):
     """
-    Sends a notification to Notify.Events channel via Source token
+    Post a notification to the Notify.Events channel, raising on failure
     """
     token = getattr(settings, "NOTIFY_EVENTS_SOURCE", None)  # source token
     if not token:
@@ -20,7 +40,87 @@ def send_notify_event(message, title="🚨 Django Alert"):
         "level": "info",
     }
 
+    with timed("notification_delivery_duration_seconds"):
+        response = requests.post(url, data=payload, timeout=5)
+        response.raise_for_status()
+
+
+def send_notify_event(message, title="🚨 Django Alert"):
+    """
+    Sends a notification to Notify.Events channel via Source token
+    """
     try:
-        requests.post(url, data=payload, timeout=5)
+        deliver_notify_event(message, title)
     except requests.RequestException as e:
-        print("Notify.Events error:", e)
\ No newline at end of file
+        logger.warning("Notify.Events error: %s", e)
+
+
+def queue_notify_event(message, title, dedupe_key):
+    """
+    Write a notification to the outbox, in the caller's transaction.
+
+    Nothing is sent here; `manage.py send_notifications` delivers it. A second
+    call with the same dedupe_key is silently ignored.
+    """
+    from main.models import Notification
+
+    Notification.objects.bulk_create(
+        [Notification(dedupe_key=dedupe_key, title=title, message=message)],
+        ignore_conflicts=True,
+    )
+
+
+def queue_order_paid_notification(order):
+    """Queue the "Order Paid" notification for an order, at most once"""
+    queue_notify_event(
+        f"✅ Order Paid!\nOrder ID: {order.id}\nCustomer: {order.full_name}\nTotal: {order.total_amount}",
+        "Order Paid",
+        dedupe_key=f"order-paid-{order.id}",
+    )
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def send_pending_notifications(batch_size=50, max_attempts=MAX_ATTEMPTS):
+    """
+    Deliver one batch of due outbox notifications. Returns how many were tried.
+    """
+    from main.models import Notification
+
+    now = timezone.now()
+
+    # Claim the batch by pushing it into the future, so other workers skip it
+    # once our row locks are released; the HTTP calls happen outside the transaction
+    with transaction.atomic():
+        batch = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        Notification.objects.filter(pk__in=[n.pk for n in batch]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+        )
+
+    sent = []
+    for notification in batch:
+        try:
+            deliver_notify_event(notification.message, notification.title)
+        except (requests.RequestException, ValueError) as e:
+            attempts = notification.attempts + 1
+            Notification.objects.filter(pk=notification.pk).update(
+                attempts=attempts,
+                status="failed" if attempts >= max_attempts else "pending",
+                next_attempt_at=timezone.now() + retry_delay(attempts),
+                last_error=str(e)[:1000],
+            )
+        else:
+            sent.append(notification.pk)
+
+    if sent:
+        Notification.objects.filter(pk__in=sent).update(
+            status="sent", sent_at=timezone.now(), attempts=F("attempts") + 1
+        )
+    return len(batch)
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.utils import timezone
+from main.models import Order
+from main.signals import order_status_changed
+
+# Target status -> statuses an order may move to it from
+TRANSITIONS = {
+    "paid": ("pending",),
+    "cancelled": ("pending",),
+    "shipped": ("paid",),
+    "completed": ("shipped",),
+}
+
+
+def _sources(new_status):
+    try:
+        return TRANSITIONS[new_status]
+    except KeyError:
+        raise ValueError(f"Unknown order status transition to {new_status!r}")
+
+
+def transition_order(order, new_status, **fields):
+    """
+    Move `order` to `new_status` if its row is still in an allowed status,
+    with one conditional UPDATE that also writes `fields`, in the same
+    transaction as the order_status_changed receivers. Returns True if this
+    call made the transition; on False, order.status holds the status that
+    won.
+    """
+    now = timezone.now()
+    # The receivers (outbox row, stock release, rollups) commit or roll back
+    # together with the status change
+    with transaction.atomic():
+        for old_status in _sources(new_status):
+            # One status per UPDATE so we know which one we moved from; every
+            # transition has a single source today, so this is one statement
+            updated = Order.objects.filter(pk=order.pk, status=old_status).update(
+                status=new_status, updated_at=now, **fields
+            )
+            if updated:
+                break
+        else:
+            order.refresh_from_db(fields=["status"])
+            order._loaded_status = order.status
+            return False
+
+        for name, value in fields.items():
+            setattr(order, name, value)
+        order.status = order._loaded_status = new_status
+        order.updated_at = now
+        order_status_changed.send(sender=Order, order=order, old_status=old_status, new_status=new_status)
+    return True
+
+
+def transition_orders(order_ids, new_status):
+    """
+    Bulk form of transition_order: moves those of `order_ids` still in an
+    allowed status and returns the ids that moved
+    """
+    sources = _sources(new_status)
+    now = timezone.now()
+    with transaction.atomic():
+        # Lock first so we know exactly which rows we move
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, status__in=sources)
+            .only(
+                "id", "status", "full_name", "transaction_ref", "total_amount",
+                "item_count", "created_at",
+            )
+        )
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+            status=new_status, updated_at=now
+        )
+        for order in orders:
+            old_status = order.status
+            order.status = order._loaded_status = new_status
+            order.updated_at = now
+            order_status_changed.send(sender=Order, order=order, old_status=old_status, new_status=new_status)
+    return [order.pk for order in orders]
+
+
+def expire_pending_orders(before, batch_size=500):
+    """
+    Cancel up to `batch_size` orders still pending since before `before`
+    (abandoned checkouts). Returns how many were looked at.
+    """
+    order_ids = list(
+        Order.objects.filter(status="pending", created_at__lt=before)
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:batch_size]
+    )
+    # Any that got paid since the SELECT are skipped by the transition
+    transition_orders(order_ids, "cancelled")
+    return len(order_ids)
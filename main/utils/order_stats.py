@@ -0,0 +1,70 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from main.models import Order
+
+# Cached counts drift only if an increment races a recompute; the timeout
+# bounds how long such a drift can last
+ORDER_STATS_TIMEOUT = 10 * 60
+
+
+def _statuses():
+    return [status for status, _ in Order.STATUS_CHOICES]
+
+
+def _key(name):
+    return f"order_stats:{name}"
+
+
+def compute_order_stats():
+    """
+    Count all orders and orders per status with one conditional-aggregate query
+    """
+    aggregates = {"total": Count("id")}
+    for status in _statuses():
+        aggregates[status] = Count("id", filter=Q(status=status))
+    return Order.objects.aggregate(**aggregates)
+
+
+def get_order_stats():
+    """
+    Return {"total": n, "<status>": n, ...}, from the cache when it's complete
+    """
+    names = ["total", *_statuses()]
+    cached = cache.get_many([_key(name) for name in names])
+    if len(cached) == len(names):
+        return {name: cached[_key(name)] for name in names}
+
+    stats = compute_order_stats()
+    cache.set_many({_key(name): stats[name] for name in names}, ORDER_STATS_TIMEOUT)
+    return stats
+
+
+def _apply(name, delta):
+    try:
+        cache.incr(_key(name), delta)
+    except ValueError:
+        # Not cached right now; the next read recomputes everything
+        pass
+
+
+def _incr(name, delta):
+    # Only once the change is committed, so a rollback leaves the counts alone
+    transaction.on_commit(partial(_apply, name, delta))
+
+
+def record_order_created(status):
+    _incr("total", 1)
+    _incr(status, 1)
+
+
+def record_order_deleted(status):
+    _incr("total", -1)
+    _incr(status, -1)
+
+
+def record_status_change(old_status, new_status):
+    _incr(old_status, -1)
+    _incr(new_status, 1)
@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from django.db import transaction
+from main.models import Order
+
+# Entries are dropped whenever an order changes status, so this only bounds
+# how long a stale entry could survive a missed invalidation
+ORDER_STATUS_TIMEOUT = 60
+
+
+def order_status_key(tx_ref):
+    return f"order_status:{tx_ref}"
+
+
+def get_order_status(tx_ref):
+    """
+    Return {"order_id", "status"} for a transaction reference, or None if no
+    order has it. Polled by the payment confirmation page, so it is cached.
+    """
+    key = order_status_key(tx_ref)
+    status = cache.get(key)
+    if status is None:
+        row = (
+            Order.objects.filter(transaction_ref=tx_ref)
+            .values("id", "status")
+            .first()
+        )
+        if row is None:
+            return None
+        status = {"order_id": row["id"], "status": row["status"]}
+        cache.set(key, status, ORDER_STATUS_TIMEOUT)
+    return status
+
+
+def forget_order_status(*tx_refs):
+    """
+    Drop cached statuses after the orders behind them changed. Waits for the
+    commit, so a poll in between can't cache the old status again.
+    """
+    keys = [order_status_key(tx_ref) for tx_ref in tx_refs if tx_ref]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,104 @@
+import base64
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """
+    Encode a (created_at, id) position into an opaque, URL-safe cursor
+    """
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor back into (created_at, id)
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded).decode().split("|")
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+    # Cursors we hand out always carry an offset; a naive one was edited
+    if created_at is None or timezone.is_naive(created_at):
+        raise InvalidCursor("Invalid cursor")
+    return created_at, pk
+
+
+def encode_offset_cursor(offset):
+    """
+    Encode a position in an ordered result set (e.g. ranked search results)
+    """
+    return base64.urlsafe_b64encode(f"offset|{offset}".encode()).decode().rstrip("=")
+
+
+def decode_offset_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, offset = base64.urlsafe_b64decode(padded).decode().split("|")
+        offset = int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+    if kind != "offset" or offset < 0:
+        raise InvalidCursor("Invalid cursor")
+    return offset
+
+
+def keyset_page(queryset, cursor=None, page_size=12):
+    """
+    Return (rows, has_next, next_cursor) for the page after `cursor`,
+    newest first.
+
+    Seeks on (created_at, id) instead of using OFFSET, and fetches one extra
+    row to work out has_next instead of running COUNT(*), so every page costs
+    the same however deep the shopper has scrolled.
+    """
+    queryset = queryset.order_by("-created_at", "-id")
+
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        # Equivalent to (created_at, id) < (cursor), with the leading
+        # created_at__lte so the database can range-scan the feed index
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(id__lt=pk),
+            created_at__lte=created_at,
+        )
+
+    rows = list(queryset[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        if isinstance(last, dict):  # a values() queryset
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        else:
+            next_cursor = encode_cursor(last.created_at, last.pk)
+
+    return rows, has_next, next_cursor
+
+
+def offset_page(queryset, cursor=None, page_size=12):
+    """
+    Like keyset_page, for querysets with their own ordering (ranked search
+    results) that can't be seeked on (created_at, id). Still no COUNT(*).
+    """
+    offset = decode_offset_cursor(cursor) if cursor else 0
+
+    rows = list(queryset[offset:offset + page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = encode_offset_cursor(offset + page_size) if has_next else None
+    return rows, has_next, next_cursor
@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from main.models import Order, PaymentEvent
+from main.utils.flutterwave import CircuitOpen, get_client
+from main.utils.notifications import CLAIM_SECONDS, retry_delay
+from main.utils.order_state import transition_order
+
+MAX_ATTEMPTS = 5
+
+
+def record_payment_event(event_type, event_id, payload):
+    """
+    Store a raw gateway event in the inbox. Duplicates (gateway retries) are
+    dropped by the unique event_key with a single INSERT ... ON CONFLICT.
+    """
+    PaymentEvent.objects.bulk_create(
+        [PaymentEvent(event_key=f"{event_type}:{event_id}", event_type=event_type, payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def find_order(tx_ref):
+    """
+    Look an order up by its transaction reference ("order_<id>_<suffix>")
+    """
+    order = Order.objects.filter(transaction_ref=tx_ref).first()
+    if order is None:
+        try:
+            order = Order.objects.filter(id=int(tx_ref.split('_')[1])).first()
+        except (IndexError, ValueError):
+            return None
+    return order
+
+
+def verify_callback(event):
+    """
+    Verify a shopper's "completed" redirect with the gateway. A GatewayError
+    propagates so the event is retried on the next poll.
+    """
+    transaction_data = event.payload.get("data") or {}
+    order = find_order(transaction_data.get("tx_ref") or "")
+    if order is None or order.status != "pending":
+        return
+
+    gateway_status = get_client().transaction_status(transaction_data["id"])
+    if gateway_status == "successful":
+        transition_order(order, "paid")
+    elif gateway_status not in ("pending", "processing"):
+        # A webhook that already marked it paid wins over this
+        transition_order(order, "cancelled")
+    # Otherwise not settled yet; the webhook or reconcile_payments finishes it
+
+
+def apply_payment_event(event):
+    """
+    Apply one inbox event to its order. Safe to run any number of times.
+    """
+    if event.event_type == "callback.completed":
+        verify_callback(event)
+        return
+
+    if event.event_type != "charge.completed":
+        return
+
+    transaction_data = event.payload.get("data") or {}
+    tx_ref = transaction_data.get("tx_ref")
+    if transaction_data.get("status") != "successful" or not tx_ref:
+        return
+
+    order = find_order(tx_ref)
+    if order is not None:
+        transition_order(order, "paid")
+
+
+def process_payment_events(batch_size=100, max_attempts=MAX_ATTEMPTS):
+    """
+    Apply one batch of due inbox events. Returns how many were applied;
+    failed events are retried with backoff until max_attempts.
+    """
+    now = timezone.now()
+
+    # Claim the batch by pushing it into the future, so other workers skip it
+    # once our row locks are released; the gateway calls made while verifying
+    # happen outside any transaction
+    with transaction.atomic():
+        batch = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        PaymentEvent.objects.filter(pk__in=[event.pk for event in batch]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+        )
+
+    processed = 0
+    for event in batch:
+        try:
+            # Each transition commits on its own; a crash before the event is
+            # marked processed only means it is applied again, as a no-op
+            apply_payment_event(event)
+        except CircuitOpen as e:
+            # The gateway is known to be down: wait for the breaker to let a
+            # trial call through, without using up an attempt
+            PaymentEvent.objects.filter(pk=event.pk).update(
+                next_attempt_at=timezone.now() + timedelta(seconds=get_client().breaker.reset_timeout),
+                last_error=str(e)[:1000],
+            )
+        except Exception as e:
+            attempts = event.attempts + 1
+            PaymentEvent.objects.filter(pk=event.pk).update(
+                attempts=attempts,
+                status="failed" if attempts >= max_attempts else "pending",
+                next_attempt_at=timezone.now() + retry_delay(attempts),
+                last_error=str(e)[:1000],
+            )
+        else:
+            PaymentEvent.objects.filter(pk=event.pk).update(
+                status="processed", processed_at=timezone.now(), attempts=F("attempts") + 1
+            )
+            processed += 1
+    return processed
@@ -0,0 +1,243 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import DatabaseError, transaction
+
+from main.utils.cache import bump_catalog_version
+from main.utils.slugs import SLUG_LENGTH, slug_base, unique_slug
+
+# Columns an import may set; "slug" picks the product to update
+IMPORT_FIELDS = ("name", "description", "price", "stock")
+IMPORT_FORMATS = ("csv", "jsonl")
+
+# Rows validated and written per transaction
+CHUNK_SIZE = 1000
+
+# Product.price is DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal("99999999.99")
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (unknown format, no columns...)"""
+
+
+def import_format(filename):
+    """The import format implied by a file name, or None"""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def read_records(file, file_format):
+    """
+    Yield (line number, record) from a binary CSV or JSONL file, one row at a
+    time. Lines that aren't a JSON object come through as None.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or not ({"name", "slug"} & set(reader.fieldnames)):
+            raise ImportFileError("The CSV needs a header row with a name or slug column")
+        for record in reader:
+            yield reader.line_num, record
+    elif file_format == "jsonl":
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    else:
+        raise ImportFileError(f"Unknown import format {file_format!r}, expected csv or jsonl")
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def clean_record(record):
+    """
+    The slug (or None) and the product fields a record sets, converted.
+    Raises ValueError with a message for the row report.
+    """
+    if record is None:
+        raise ValueError("Not a JSON object")
+
+    slug = record.get("slug")
+    slug = None if _blank(slug) else str(slug).strip()
+    if slug is not None:
+        if len(slug) > SLUG_LENGTH:
+            raise ValueError(f"slug is longer than {SLUG_LENGTH} characters")
+        try:
+            validate_slug(slug)
+        except ValidationError:
+            raise ValueError(f"slug {slug!r} may only use letters, numbers, hyphens and underscores")
+
+    fields = {}
+    # A blank name or price (e.g. an empty CSV cell) leaves it as it is
+    if not _blank(record.get("name")):
+        name = str(record["name"]).strip()
+        if len(name) > 200:
+            raise ValueError("name is longer than 200 characters")
+        fields["name"] = name
+    if "description" in record:
+        fields["description"] = "" if record["description"] is None else str(record["description"])
+    if not _blank(record.get("price")):
+        try:
+            price = Decimal(str(record["price"]).strip())
+        except InvalidOperation:
+            raise ValueError(f"price {record['price']!r} is not a number")
+        if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+            raise ValueError(f"price {record['price']!r} is out of range")
+        fields["price"] = price.quantize(Decimal("0.01"))
+    if "stock" in record:
+        # Blank means stock isn't tracked, as in the product form
+        stock = record["stock"]
+        if _blank(stock):
+            fields["stock"] = None
+        elif isinstance(stock, int) or (isinstance(stock, str) and stock.strip().isdigit()):
+            fields["stock"] = int(stock)
+            if fields["stock"] < 0:
+                raise ValueError("stock can't be negative")
+        else:
+            raise ValueError(f"stock {stock!r} is not a whole number")
+    return slug, fields
+
+
+def _write_chunk(creates, updates, taken, report):
+    """
+    Write one chunk in a transaction. If the database refuses it, retry the
+    rows one by one so only the bad rows are reported and skipped.
+    """
+    from main.models import Product
+
+    def write(creates, updates):
+        if creates:
+            # Plain INSERTs: a slug another writer took since we loaded them
+            # fails the chunk rather than overwriting that product
+            Product.objects.bulk_create([product for _, product, _ in creates])
+        # Updates are upserts (one INSERT ... ON CONFLICT per set of columns),
+        # which is far cheaper than bulk_update's CASE per row; only the
+        # columns the row provides are overwritten
+        by_fields = {}
+        for line, product, fields in updates:
+            by_fields.setdefault(fields, []).append(product)
+        for fields, products in by_fields.items():
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=["slug"],
+                update_fields=[*fields, "updated_at"],
+            )
+
+    try:
+        with transaction.atomic():
+            write(creates, updates)
+    except DatabaseError:
+        for create in creates:
+            line, product, generated = create
+            if Product.objects.filter(slug=product.slug).exists():
+                if not generated:
+                    report["errors"].append((line, f"slug {product.slug!r} was taken by another product meanwhile"))
+                    continue
+                # Suffixed from the name: move on to the next free suffix
+                base = slug_base(product.name)
+                taken.update(Product.objects.filter(slug__startswith=base).values_list("slug", flat=True))
+                product.slug = unique_slug(base, taken)
+            _write_row(write, [create], [], line, report)
+        for update in updates:
+            _write_row(write, [], [update], update[0], report)
+        return
+
+    report["created"] += len(creates)
+    report["updated"] += len(updates)
+
+
+def _write_row(write, creates, updates, line, report):
+    try:
+        with transaction.atomic():
+            write(creates, updates)
+    except DatabaseError as e:
+        report["errors"].append((line, f"Not saved: {e}"))
+    else:
+        report["created"] += len(creates)
+        report["updated"] += len(updates)
+
+
+def import_products(records, chunk_size=CHUNK_SIZE, dry_run=False):
+    """
+    Create or update products from (line number, record) pairs, as yielded by
+    read_records. A record with the slug of an existing product updates the
+    columns it has; any other record creates a product and needs a name and
+    price. Products without a slug get one from their name, suffixed ("-2")
+    when taken.
+
+    Bad rows are reported and skipped, the rest is written in chunks.
+    Returns {"created": n, "updated": n, "errors": [(line, message), ...]}.
+    """
+    from main.models import Product
+
+    report = {"created": 0, "updated": 0, "errors": []}
+    # One query for every slug in use; collisions are then resolved in memory.
+    # The required columns come along to fill the INSERT half of an update
+    existing = {
+        slug: (name, price)
+        for slug, name, price in Product.objects.values_list("slug", "name", "price")
+    }
+    taken = set(existing)
+    seen = {}
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+
+        creates, updates = [], []
+        for line, record in chunk:
+            try:
+                slug, fields = clean_record(record)
+                if slug is not None and slug in seen:
+                    raise ValueError(f"slug {slug!r} already appears on line {seen[slug]}")
+
+                if slug in existing:
+                    if not fields:
+                        raise ValueError("Nothing to update")
+                    name, price = existing[slug]
+                    product = Product(**{"slug": slug, "name": name, "price": price, **fields})
+                    updates.append((line, product, tuple(sorted(fields))))
+                else:
+                    missing = [name for name in ("name", "price") if name not in fields]
+                    if missing:
+                        raise ValueError(f"A new product needs {' and '.join(missing)}")
+                    generated = slug is None
+                    if generated:
+                        slug = unique_slug(slug_base(fields["name"]), taken)
+                    elif slug in taken:
+                        raise ValueError(f"slug {slug!r} was already given to another row")
+                    taken.add(slug)
+                    fields.setdefault("description", "")
+                    fields.setdefault("stock", None)
+                    creates.append((line, Product(slug=slug, **fields), generated))
+                seen[slug] = line
+            except ValueError as e:
+                report["errors"].append((line, str(e)))
+
+        if dry_run:
+            report["created"] += len(creates)
+            report["updated"] += len(updates)
+        else:
+            _write_chunk(creates, updates, taken, report)
+
+    if not dry_run and (report["created"] or report["updated"]):
+        # Bulk writes skip post_save, so invalidate the catalog cache once here
+        bump_catalog_version()
+    return report
@@ -0,0 +1,177 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from main.utils.exports import day_start
+
+# Statuses in which an order counts towards sales
+SOLD_STATUSES = ("paid", "shipped", "completed")
+
+
+def _add_to_rollups(model, rows, unique_fields, counters):
+    """
+    Add each row's counters onto the model's matching row, creating rows that
+    don't exist yet, with one INSERT ... ON CONFLICT DO UPDATE. Other columns
+    take the new value.
+    """
+    fields = list(rows[0])
+    meta = model._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    columns = {name: quote(meta.get_field(name).column) for name in fields}
+
+    updates = [
+        f"{columns[name]} = {table}.{columns[name]} + EXCLUDED.{columns[name]}"
+        if name in counters else f"{columns[name]} = EXCLUDED.{columns[name]}"
+        for name in fields if name not in unique_fields
+    ]
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * len(fields)) + ")"] * len(rows))
+    params = [
+        meta.get_field(name).get_db_prep_save(row[name], connection)
+        for row in rows for name in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns.values())}) VALUES {placeholders} "
+            f"ON CONFLICT ({', '.join(columns[name] for name in unique_fields)}) "
+            f"DO UPDATE SET {', '.join(updates)}",
+            params,
+        )
+
+
+def record_sales_change(order, old_status, new_status):
+    """
+    Adjust the rollups of the order's day for one status change, in the
+    caller's transaction: add the order when it becomes sold, take it back
+    out if it stops being sold, and count cancellations.
+    """
+    from main.models import DailyProductSales, DailySales, OrderItem
+
+    sold = (new_status in SOLD_STATUSES) - (old_status in SOLD_STATUSES)
+    cancelled = (new_status == "cancelled") - (old_status == "cancelled")
+    if not sold and not cancelled:
+        return
+
+    day = timezone.localdate(order.created_at)
+    # Added in SQL, so concurrent changes to the same day can't overwrite each other
+    _add_to_rollups(DailySales, [{
+        "date": day,
+        "orders": sold,
+        "units": sold * order.item_count,
+        "revenue": sold * order.total_amount,
+        "cancelled_orders": cancelled,
+    }], unique_fields=["date"], counters=["orders", "units", "revenue", "cancelled_orders"])
+    if not sold:
+        return
+
+    items = (
+        OrderItem.objects.filter(order_id=order.pk)
+        .values_list("product_id", "product__name")
+        .annotate(units=Sum("quantity"), revenue=Sum(F("price") * F("quantity")))
+        .order_by()
+    )
+    rows = [
+        {"date": day, "product": product_id, "product_name": name,
+         "units": sold * units, "revenue": sold * revenue}
+        for product_id, name, units, revenue in items
+    ]
+    if rows:
+        _add_to_rollups(
+            DailyProductSales, rows, unique_fields=["date", "product"], counters=["units", "revenue"],
+        )
+
+
+def record_new_order_sales(order_id, status):
+    """
+    Count an order that was created already past pending (e.g. in the Django
+    admin). Run on commit, once its items are saved.
+    """
+    from main.models import Order
+
+    order = Order.objects.filter(pk=order_id).only("created_at", "item_count", "total_amount").first()
+    if order is not None:
+        record_sales_change(order, None, status)
+
+
+def _date_range(queryset, field, since, until):
+    if since:
+        queryset = queryset.filter(**{f"{field}__gte": day_start(since)})
+    if until:
+        queryset = queryset.filter(**{f"{field}__lt": day_start(until + timedelta(days=1))})
+    return queryset
+
+
+def rebuild_sales_rollups(since=None, until=None, batch_size=1000):
+    """
+    Recompute the rollups for order dates from `since` to `until` (both
+    inclusive, None for open-ended) from live and archived orders, with
+    grouped queries. Returns (days, product-day rows) written.
+    """
+    from main.models import (
+        ArchivedOrder, ArchivedOrderItem, DailyProductSales, DailySales, Order, OrderItem,
+    )
+
+    sold = Q(status__in=SOLD_STATUSES)
+    days = defaultdict(lambda: {"orders": 0, "units": 0, "revenue": 0, "cancelled_orders": 0})
+    for model in (Order, ArchivedOrder):
+        rows = (
+            _date_range(model.objects.all(), "created_at", since, until)
+            .annotate(day=TruncDate("created_at"))
+            .values("day")
+            .annotate(
+                orders=Count("id", filter=sold),
+                units=Sum("item_count", filter=sold, default=0),
+                revenue=Sum("total_amount", filter=sold, default=0),
+                cancelled_orders=Count("id", filter=Q(status="cancelled")),
+            )
+            .order_by()
+        )
+        for row in rows:
+            totals = days[row.pop("day")]
+            for name, value in row.items():
+                totals[name] += value
+
+    products = defaultdict(lambda: {"product_name": "", "units": 0, "revenue": 0})
+    for model, name in ((OrderItem, "product__name"), (ArchivedOrderItem, "product_name")):
+        rows = (
+            _date_range(model.objects.filter(order__status__in=SOLD_STATUSES), "order__created_at", since, until)
+            .annotate(day=TruncDate("order__created_at"))
+            .values("day", "product_id")
+            .annotate(
+                name=Max(name),
+                units=Sum("quantity"),
+                revenue=Sum(F("price") * F("quantity")),
+            )
+            .order_by()
+        )
+        for row in rows:
+            totals = products[row["day"], row["product_id"]]
+            totals["product_name"] = totals["product_name"] or row["name"] or ""
+            totals["units"] += row["units"]
+            totals["revenue"] += row["revenue"]
+
+    with transaction.atomic():
+        for model in (DailySales, DailyProductSales):
+            rollups = model.objects.all()
+            if since:
+                rollups = rollups.filter(date__gte=since)
+            if until:
+                rollups = rollups.filter(date__lte=until)
+            rollups.delete()
+
+        DailySales.objects.bulk_create(
+            [DailySales(date=day, **totals) for day, totals in days.items()],
+            batch_size=batch_size,
+        )
+        DailyProductSales.objects.bulk_create(
+            [
+                DailyProductSales(date=day, product_id=product_id, **totals)
+                for (day, product_id), totals in products.items()
+            ],
+            batch_size=batch_size,
+        )
+    return len(days), len(products)
@@ -0,0 +1,109 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection, DatabaseError
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+# The SQLite fallback ranks in FTS5 and hands the ids back to Django, so cap
+# how many it returns (it is only meant for local runs)
+SQLITE_RESULT_LIMIT = 500
+
+SQLITE_FTS_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS main_product_fts USING fts5(
+        name, description, content='main_product', content_rowid='id',
+        tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS main_product_fts_ai AFTER INSERT ON main_product BEGIN
+        INSERT INTO main_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS main_product_fts_ad AFTER DELETE ON main_product BEGIN
+        INSERT INTO main_product_fts(main_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS main_product_fts_au AFTER UPDATE OF name, description ON main_product BEGIN
+        INSERT INTO main_product_fts(main_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO main_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    "INSERT INTO main_product_fts(main_product_fts) VALUES ('rebuild')",
+]
+
+
+def _terms(query):
+    return re.findall(r"[^\W_]+", query)
+
+
+def setup_sqlite_fts(using_connection):
+    """
+    Create (or repair) the FTS5 index used for local SQLite runs.
+
+    SQLite drops triggers whenever a migration rebuilds main_product, so this
+    runs after every migrate instead of once in a migration.
+    """
+    if using_connection.vendor != "sqlite":
+        return
+    try:
+        with using_connection.cursor() as cursor:
+            for statement in SQLITE_FTS_SETUP:
+                cursor.execute(statement)
+    except DatabaseError:
+        # SQLite built without FTS5: search_products falls back to icontains
+        pass
+
+
+def _search_postgres(queryset, query, terms):
+    # Prefix-match every term so results update as the shopper types. The
+    # 'simple' config skips stemming, which would break prefixes ("runn" vs "run")
+    tsquery = SearchQuery(
+        " & ".join(f"{term}:*" for term in terms), search_type="raw", config="simple"
+    )
+    return (
+        queryset.annotate(
+            search_rank=SearchRank(F("search_vector"), tsquery),
+            similarity=TrigramSimilarity("name", query),
+        )
+        .filter(Q(search_vector=tsquery) | Q(name__trigram_similar=query))
+        .order_by("-search_rank", "-similarity", "-created_at", "-id")
+    )
+
+
+def _search_sqlite(queryset, terms):
+    match = " ".join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT rowid FROM main_product_fts WHERE main_product_fts MATCH %s "
+            "ORDER BY bm25(main_product_fts, 10.0, 1.0) LIMIT %s",
+            [match, SQLITE_RESULT_LIMIT],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    if not ids:
+        return queryset.none()
+    return (
+        queryset.filter(pk__in=ids)
+        .annotate(search_rank=Case(
+            *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        ))
+        .order_by("search_rank")
+    )
+
+
+def search_products(queryset, query):
+    """
+    Filter a Product queryset by `query` and order it by relevance.
+
+    PostgreSQL uses the trigger-maintained search_vector (GIN indexed) plus
+    trigram similarity on the name for typos; SQLite uses the FTS5 index.
+    Anything else falls back to name__icontains.
+    """
+    terms = _terms(query)
+    if terms and connection.vendor == "postgresql":
+        return _search_postgres(queryset, query, terms)
+    if terms and connection.vendor == "sqlite":
+        try:
+            return _search_sqlite(queryset, terms)
+        except DatabaseError:
+            pass
+    return queryset.filter(name__icontains=query).order_by("-created_at", "-id")
@@ -0,0 +1,23 @@
+from django.utils.text import slugify
+
+# Product.slug's max_length
+SLUG_LENGTH = 50
+
+
+def slug_base(name):
+    """The slug a product name starts from, before any "-2" suffix"""
+    return slugify(name)[:SLUG_LENGTH].strip("-") or "product"
+
+
+def unique_slug(base, taken):
+    """
+    `base`, or `base-2`, `base-3`, ... whichever is not in `taken`. Adds the
+    result to `taken`, so a batch of names can be resolved against one set.
+    """
+    slug, n = base, 1
+    while slug in taken:
+        n += 1
+        suffix = f"-{n}"
+        slug = base[:SLUG_LENGTH - len(suffix)].rstrip("-") + suffix
+    taken.add(slug)
+    return slug
@@ -0,0 +1,135 @@
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+# A slot counter outlives its last acquire (e.g. by a crashed request) by at most this long
+SLOT_TTL = 120
+
+
+def parse_rate(rate):
+    """
+    "10/m" -> (10, 60): a bucket of 10 tokens, refilled at 10 per minute
+    """
+    count, period = rate.split("/")
+    return int(count), PERIODS[period.strip()[0]]
+
+
+def client_ip(request):
+    if getattr(settings, "THROTTLE_TRUST_X_FORWARDED_FOR", False):
+        # Behind a proxy REMOTE_ADDR is the proxy; it appends the real client last
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def take_token(scope, ident, rate):
+    """
+    Take one token from the (scope, ident) bucket. Returns 0 when allowed,
+    otherwise how many seconds until a token is available.
+
+    The bucket lives in the cache as (tokens, last refill time). The
+    read-modify-write isn't atomic, so concurrent requests from one client
+    can slip a few extra through; that's fine for shedding abuse.
+    """
+    capacity, period = parse_rate(rate)
+    refill_per_second = capacity / period
+    key = f"throttle:{scope}:{ident}"
+    now = time.time()
+
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+    if tokens < 1:
+        return (1 - tokens) / refill_per_second
+
+    cache.set(key, (tokens - 1, now), timeout=period)
+    return 0
+
+
+def _too_many(message, retry_after, status=429):
+    response = JsonResponse({"error": message}, status=status)
+    response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def throttle(scope):
+    """
+    Limit a view per client IP with the token bucket rate in
+    settings.THROTTLE_RATES[scope]; over the limit it answers 429 at once
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rate = getattr(settings, "THROTTLE_RATES", {}).get(scope)
+            if rate:
+                wait = take_token(scope, client_ip(request), rate)
+                if wait:
+                    return _too_many("Too many requests, please slow down", wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ConcurrencyLimit:
+    """
+    Counts in-flight work for `scope` in the cache, allowing at most `limit`
+    at once. Global across workers when the cache is shared (CACHE_URL).
+    """
+
+    def __init__(self, scope, limit):
+        self.key = f"inflight:{scope}"
+        self.limit = limit
+
+    def acquire(self):
+        cache.add(self.key, 0, timeout=SLOT_TTL)
+        try:
+            count = cache.incr(self.key)
+        except ValueError:
+            # Expired between add and incr; start over
+            cache.add(self.key, 1, timeout=SLOT_TTL)
+            count = 1
+        # Keep the counter alive while slots keep being taken; the TTL only
+        # runs out once nothing has been acquired for SLOT_TTL seconds
+        cache.touch(self.key, SLOT_TTL)
+        if count > self.limit:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        try:
+            if cache.decr(self.key) < 0:
+                # The counter expired (and restarted) while this slot was held
+                cache.incr(self.key)
+        except ValueError:
+            pass
+
+
+def limit_concurrency(scope):
+    """
+    Shed requests with a fast 503 and Retry-After while
+    settings.CONCURRENCY_LIMITS[scope] of them are already in flight,
+    instead of letting them queue for a worker
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limit = getattr(settings, "CONCURRENCY_LIMITS", {}).get(scope)
+            if not limit:
+                return view(request, *args, **kwargs)
+
+            slots = ConcurrencyLimit(scope, limit)
+            if not slots.acquire():
+                return _too_many("We're busy right now, please try again shortly", 2, status=503)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                slots.release()
+        return wrapper
+    return decorator
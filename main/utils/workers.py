@@ -0,0 +1,44 @@
+import time
+from abc import ABC, abstractmethod
+
+from django.core.management.base import BaseCommand
+
+
+class PollingCommand(BaseCommand, ABC):
+    """
+    Base for background worker commands that drain a table in batches.
+
+    Subclasses must implement process_batch(batch_size) (a command without
+    it can't be instantiated) and return how many rows they handled; the
+    loop only sleeps when a batch comes back empty.
+    """
+    default_batch_size = 50
+    default_interval = 5.0
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process what is due and exit")
+        parser.add_argument("--batch-size", type=int, default=self.default_batch_size)
+        parser.add_argument(
+            "--interval", type=float, default=self.default_interval,
+            help="Seconds to sleep when there is nothing to do",
+        )
+
+    @abstractmethod
+    def process_batch(self, batch_size):
+        """Handle up to batch_size due rows; return how many were handled"""
+
+    def handle(self, *args, **options):
+        self.options = options
+        batch_size = options["batch_size"]
+        total = 0
+        try:
+            while True:
+                processed = self.process_batch(batch_size)
+                total += processed
+                if not processed:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Processed {total}")
@@ -1,10 +1,90 @@
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.shortcuts import render, get_object_or_404
 from .models import *
 from django.views.decorators.http import require_GET
 import json
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.db.models import CharField, F
+from django.db.models.functions import Cast, Substr
+from .utils.pagination import keyset_page, offset_page, InvalidCursor
+from .utils.search import search_products
+from .utils.cache import cached_catalog
+from .utils.feed import DESCRIPTION_LENGTH, image_url, truncate, json_response
+from .utils.images import variant_srcset, variant_url
+
+def feed_rows(products):
+    """
+    Only the columns a product card needs, as dicts: the description cut
+    down in SQL and the raw image path instead of a file/Cloudinary object
+    """
+    image_name = F('image')
+    if settings.USE_CLOUDINARY:
+        # values() would still build a CloudinaryResource; read the raw text
+        image_name = Cast('image', output_field=CharField())
+    return products.annotate(
+        description_start=Substr('description', 1, DESCRIPTION_LENGTH + 1),
+        image_name=image_name,
+    ).values(
+        'id', 'name', 'slug', 'price', 'created_at', 'description_start', 'image_name',
+        'image_variants',
+    )
+
+
+def product_feed(cursor, search_query):
+    """Build the page of the product feed after `cursor` ('' for the first) as a JSON-ready dict"""
+    products = Product.objects.all()
+    if search_query:
+        products = search_products(products, search_query)
+    else:
+        products = products.order_by('-created_at', '-id')
+    products = feed_rows(products)
+
+    if search_query:
+        # Ranked search results page through their own relevance order
+        page_products, has_next, next_cursor = offset_page(products, cursor, 12)
+    else:
+        # Seek on (created_at, id), no OFFSET and no COUNT(*)
+        page_products, has_next, next_cursor = keyset_page(products, cursor, 12)
+
+    return {
+        'results': [serialize_product(product) for product in page_products],
+        'has_next': has_next,
+        'next_cursor': next_cursor,
+    }
+
+
+def serialize_product(row):
+    """The product card data, for both the JSON feed and the first page in the HTML"""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'slug': row['slug'],
+        'description': truncate(row['description_start'] or ''),
+        'price': str(row['price']),
+        # Resized local copies when built; the original until then
+        'image': variant_url(row['image_variants'], 'jpeg') or image_url(row['image_name']),
+        'srcset': variant_srcset(row['image_variants'], 'webp'),
+    }
+
+
+def feed_cursor(page, cursor):
+    """
+    The cursor a feed request pages from. Old ?page=N links without one only
+    get the first page; deeper pages need the cursor the previous one returned.
+    """
+    if cursor is None and str(page).strip() != '1':
+        raise InvalidCursor('Pages after the first need the cursor from the previous page')
+    return cursor or ''
+
+
+def cached_product_feed(cursor, search_query):
+    # Served from the versioned catalog cache; only misses reach the database
+    return cached_catalog(
+        ('feed', cursor, search_query),
+        lambda: product_feed(cursor, search_query),
+    )
+
 
 def products(request):
     # Check if it's an AJAX request (JSON requested) or if 'page' parameter exists
@@ -17,37 +97,29 @@ def products(request):
     if is_ajax:
         # AJAX request for infinite scroll
         page = request.GET.get('page', 1)
+        cursor = request.GET.get('cursor')
         search_query = request.GET.get('q', '')
-        
-        products = Product.objects.all()
-        if search_query:
-            products = products.filter(name__icontains=search_query)
-            
-        paginator = Paginator(products, 12)  
-        page_obj = paginator.get_page(page)
-        
-        data = {
-            'results': [
-                {
-                    'id': product.id,
-                    'name': product.name,
-                    'slug': product.slug,
-                    'description': product.description,
-                    'price': str(product.price),
-                    'image': product.image.url if product.image else '',
-                }
-                for product in page_obj
-            ],
-            'has_next': page_obj.has_next()
-        }
-        return JsonResponse(data)
+
+        try:
+            data = cached_product_feed(feed_cursor(page, cursor), search_query)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return json_response(data)
     
-    # Initial page load
-    return render(request, 'main/products.html')
+    # Initial page load: embed the first page (the same entry the first
+    # infinite-scroll fetch would get), so products paint without a round trip
+    return render(request, 'main/products.html', {
+        'initial_feed': cached_product_feed('', ''),
+    })
 
 
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug)
+    product = cached_catalog(
+        ('detail', slug),
+        lambda: Product.objects.filter(slug=slug).first(),
+    )
+    if product is None:
+        raise Http404("No Product matches the given query.")
 
     return render(request, "main/detail.html", {"product": product})
 
@@ -61,11 +133,27 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.urls import reverse
+from django.db import transaction
+import hmac
 import json
-import requests
+import logging
 import uuid
 from decimal import Decimal
 from .models import Product, Order, OrderItem
+from .utils.flutterwave import get_client as get_flutterwave_client, GatewayError
+from .utils.payment_events import record_payment_event
+from .utils.order_status import get_order_status
+from .utils.order_state import transition_order
+from .utils.inventory import reserve_stock, release_stock, OutOfStock
+from .utils.idempotency import idempotent
+from .utils.throttle import throttle, limit_concurrency
+from django.views.decorators.cache import never_cache
+
+logger = logging.getLogger(__name__)
+
+# PaymentEvent.event_type is 50 characters and event_key 150
+WEBHOOK_EVENT_TYPE_LENGTH = 50
+WEBHOOK_EVENT_ID_LENGTH = 150 - WEBHOOK_EVENT_TYPE_LENGTH - 1
 
 
 def checkout_view(request):
@@ -75,6 +163,9 @@ def checkout_view(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@throttle("checkout")
+@idempotent("checkout")
+@limit_concurrency("gateway")
 def process_checkout(request):
     """Process the checkout form and create order"""
     try:
@@ -94,54 +185,85 @@ def process_checkout(request):
         if not items:
             return JsonResponse({'error': 'No items in cart'}, status=400)
         
-        # Create order
-        order = Order.objects.create(
-            full_name=full_name,
-            email=email,
-            phone=phone,
-            address=address,
-            status='pending'
-        )
-        
-        # Process order items and calculate total
-        total_amount = Decimal('0.00')
-        order_items_data = []
-        
-        for item_data in items:
-            try:
-                product = get_object_or_404(Product, id=item_data['id'])
+        # Validate every line before writing anything
+        cart_lines = []
+        try:
+            for item_data in items:
+                product_id = int(item_data['id'])
                 quantity = int(item_data['quantity'])
                 
                 if quantity <= 0:
                     raise ValueError("Invalid quantity")
                 
-                # Create order item
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    price=product.price
+                cart_lines.append((product_id, quantity))
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'error': f'Invalid item data: {str(e)}'}, status=400)
+        
+        # Load every product in the cart with one query
+        products = Product.objects.in_bulk({product_id for product_id, _ in cart_lines})
+        
+        # Process order items and calculate total
+        total_amount = Decimal('0.00')
+        order_items = []
+        order_items_data = []
+        
+        for product_id, quantity in cart_lines:
+            product = products.get(product_id)
+            if product is None:
+                return JsonResponse({'error': f'Invalid item data: Product {product_id} does not exist'}, status=400)
+            
+            order_items.append(OrderItem(
+                product=product,
+                quantity=quantity,
+                price=product.price
+            ))
+            
+            item_total = product.price * quantity
+            total_amount += item_total
+            
+            order_items_data.append({
+                'name': product.name,
+                'quantity': quantity,
+                'price': str(product.price),
+                'total': str(item_total)
+            })
+        
+        # Stock to take, per tracked product
+        reserve = {}
+        for product_id, quantity in cart_lines:
+            if products[product_id].stock is not None:
+                reserve[product_id] = reserve.get(product_id, 0) + quantity
+        
+        # Reserve stock and create the order and all its items together
+        try:
+            with transaction.atomic():
+                stock_reserved = reserve_stock(reserve)
+                order = Order.objects.create(
+                    full_name=full_name,
+                    email=email,
+                    phone=phone,
+                    address=address,
+                    status='pending',
+                    total_amount=total_amount,
+                    item_count=sum(quantity for _, quantity in cart_lines),
+                    stock_reserved=stock_reserved
                 )
-                
-                item_total = product.price * quantity
-                total_amount += item_total
-                
-                order_items_data.append({
-                    'name': product.name,
-                    'quantity': quantity,
-                    'price': str(product.price),
-                    'total': str(item_total)
-                })
-                
-            except (Product.DoesNotExist, ValueError, KeyError) as e:
-                # Clean up the order if there's an error
-                order.delete()
-                return JsonResponse({'error': f'Invalid item data: {str(e)}'}, status=400)
+                for order_item in order_items:
+                    order_item.order = order
+                OrderItem.objects.bulk_create(order_items)
+        except OutOfStock as e:
+            names = ', '.join(products[product_id].name for product_id in e.product_ids)
+            return JsonResponse({
+                'error': f'Not enough stock for: {names}',
+                'out_of_stock': e.product_ids,
+            }, status=409)
         
-        # Generate payment link with Flutterwave
+        # Generate payment link with Flutterwave (outside the transaction, so
+        # a slow gateway never holds it open)
         payment_link = create_flutterwave_payment_link(request, order, total_amount)
         
         if not payment_link:
+            release_stock(order.pk)
             order.delete()
             return JsonResponse({'error': 'Failed to create payment link'}, status=500)
         
@@ -175,7 +297,7 @@ def create_flutterwave_payment_link(request, order, amount):
     FLUTTERWAVE_PUBLIC_KEY = getattr(settings, 'FLUTTERWAVE_PUBLIC_KEY', '')
     
     if not FLUTTERWAVE_SECRET_KEY:
-        print("Warning: FLUTTERWAVE_SECRET_KEY not configured")
+        logger.warning("FLUTTERWAVE_SECRET_KEY not configured")
         return None
     
     # Generate unique transaction reference
@@ -202,39 +324,28 @@ def create_flutterwave_payment_link(request, order, amount):
         }
     }
     
-    headers = {
-        'Authorization': f'Bearer {FLUTTERWAVE_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
     try:
-        response = requests.post(
-            'https://api.flutterwave.com/v3/payments',
-            json=payment_data,
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('status') == 'success':
-                 #Store transaction reference in order (you might want to add this field to your Order model)
-                order.transaction_ref = tx_ref
-                order.save()
-                
-                return result['data']['link']
-        
-        print(f"Flutterwave API Error: {response.status_code} - {response.text}")
-        return None
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Flutterwave Request Error: {str(e)}")
+        payment_link = get_flutterwave_client().create_payment(payment_data)
+    except GatewayError:
         return None
 
+    if payment_link:
+        # Store transaction reference in order
+        order.transaction_ref = tx_ref
+        order.save(update_fields=['transaction_ref', 'updated_at'])
+
+    return payment_link
+
 
 @csrf_exempt
 def payment_callback(request):
-    """Handle payment callback from Flutterwave"""
+    """
+    Handle the shopper's redirect back from Flutterwave.
+
+    Never calls the gateway: a completed payment is queued for verification
+    by the process_payment_events worker and the shopper gets a page that
+    polls payment_status until the order settles.
+    """
 
     if request.method == 'GET':
         # Handle redirect callback
@@ -252,106 +363,103 @@ def payment_callback(request):
                     'error': 'Invalid order reference'
                 })
 
-            # Save transaction info regardless of status
-            order.transaction_ref = tx_ref
-            order.flutterwave_transaction_id = transaction_id
-            order.payment_method = payment_type or "Flutterwave"
-            order.save()
-
-            if status == 'completed' and transaction_id:
-                # Verify the payment
-                if verify_flutterwave_payment(transaction_id):
-                    order.status = 'paid'
-                    order.save()
-                    total = order.get_total_amount()
-                    return render(request, 'main/payment/payment_success.html', {
-                        'order': order,
-                        'transaction_id': transaction_id,
-                        'total': total,
-                    })
-                else:
-                    order.status = 'cancelled'
-                    order.save()
-                    return render(request, 'main/payment/payment_error.html', {
-                        'error': 'Payment verification failed. Your order has been cancelled.'
-                    })
-            else:
-                order.status = 'cancelled'
-                order.save()
-                return render(request, 'main/payment/payment_error.html', {
-                    'error': 'Payment was not successful. Your order has been cancelled.'
+            completed = status == 'completed' and transaction_id
+
+            # Save transaction info regardless of status, in one write
+            # (and none at all when the shopper reloads the page)
+            gateway_fields = {
+                'transaction_ref': tx_ref,
+                'flutterwave_transaction_id': transaction_id,
+                'payment_method': payment_type or "Flutterwave",
+            }
+            changed = {name: value for name, value in gateway_fields.items() if getattr(order, name) != value}
+            if not completed and order.status == 'pending' and transition_order(order, 'cancelled', **changed):
+                changed = {}
+            if changed:
+                for name, value in changed.items():
+                    setattr(order, name, value)
+                order.save(update_fields=[*changed, 'updated_at'])
+
+            if order.status == 'pending':
+                # Duplicate callbacks for one transaction collapse into one job
+                record_payment_event('callback.completed', transaction_id, {
+                    'data': {'id': transaction_id, 'tx_ref': tx_ref, 'status': status},
+                })
+                return render(request, 'main/payment/payment_pending.html', {
+                    'order': order,
+                    'status_url': reverse('payment_status', args=[tx_ref]),
                 })
 
+            if order.status in ('paid', 'shipped', 'completed'):
+                return render(request, 'main/payment/payment_success.html', {
+                    'order': order,
+                    'transaction_id': transaction_id,
+                    'total': order.total_amount,
+                })
+
+            if completed:
+                error = 'Payment verification failed. Your order has been cancelled.'
+            else:
+                error = 'Payment was not successful. Your order has been cancelled.'
+            return render(request, 'main/payment/payment_error.html', {'error': error})
+
     return render(request, 'main/payment/payment_error.html', {
         'error': 'Invalid request method'
     })
 
 
-def verify_flutterwave_payment(transaction_id):
-    """Verify payment with Flutterwave"""
-    
-    FLUTTERWAVE_SECRET_KEY = getattr(settings, 'FLUTTERWAVE_SECRET_KEY', '')
-    
-    if not FLUTTERWAVE_SECRET_KEY:
-        return False
-    
-    headers = {
-        'Authorization': f'Bearer {FLUTTERWAVE_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    try:
-        response = requests.get(
-            f'https://api.flutterwave.com/v3/transactions/{transaction_id}/verify',
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return (result.get('status') == 'success' and 
-                   result.get('data', {}).get('status') == 'successful')
-        
-        return False
-        
-    except requests.exceptions.RequestException:
-        return False
-
+@never_cache
+@require_GET
+def payment_status(request, tx_ref):
+    """Lightweight order status for the payment confirmation page to poll"""
+    status = get_order_status(tx_ref)
+    if status is None:
+        return JsonResponse({'error': 'Order not found'}, status=404)
+    return JsonResponse(status)
 
 
 @csrf_exempt
+@throttle("payment_webhook")
 def payment_webhook(request):
-    """Handle webhook notifications from Flutterwave"""
+    """
+    Acknowledge webhook notifications from Flutterwave.
+
+    Only checks the signature and stores the raw event; the
+    process_payment_events worker applies it to the order.
+    """
     
     if request.method == 'POST':
+        # Flutterwave echoes the dashboard secret hash in the verif-hash header.
+        # Unsigned events would mark orders paid, so only local runs accept them
+        secret_hash = getattr(settings, 'FLUTTERWAVE_SECRET_HASH', '')
+        if not secret_hash and not settings.DEBUG:
+            logger.error("FLUTTERWAVE_SECRET_HASH not configured, refusing webhook")
+            return JsonResponse({'status': 'error'}, status=401)
+        if secret_hash and not hmac.compare_digest(request.headers.get('verif-hash', ''), secret_hash):
+            return JsonResponse({'status': 'error'}, status=401)
+
         try:
             data = json.loads(request.body)
-            
-            # Verify webhook signature (recommended for production)
-            # You can implement webhook signature verification here
-            
-            if data.get('event') == 'charge.completed':
-                transaction_data = data.get('data', {})
-                tx_ref = transaction_data.get('tx_ref')
-                status = transaction_data.get('status')
-                
-                if status == 'successful' and tx_ref:
-                    try:
-                        order_id = tx_ref.split('_')[1]
-                        order = Order.objects.get(id=order_id)
-                        
-                        if order.status == 'pending':
-                            order.status = 'paid'
-                            order.save()
-                            
-                            # You can add additional logic here like sending confirmation emails
-                            
-                    except (Order.DoesNotExist, IndexError, ValueError):
-                        pass
-            
-            return JsonResponse({'status': 'success'})
-            
         except json.JSONDecodeError:
             return JsonResponse({'status': 'error'}, status=400)
+
+        if not isinstance(data, dict):
+            return JsonResponse({'status': 'error'}, status=400)
+
+        event_type = data.get('event') or ''
+        transaction_data = data.get('data') or {}
+        if not isinstance(event_type, str) or not isinstance(transaction_data, dict):
+            return JsonResponse({'status': 'error'}, status=400)
+        event_id = transaction_data.get('id') or transaction_data.get('tx_ref')
+        if event_id is not None and (isinstance(event_id, bool) or not isinstance(event_id, (str, int))):
+            return JsonResponse({'status': 'error'}, status=400)
+
+        if event_id:
+            # Must fit PaymentEvent.event_type and event_key ("<event>:<id>")
+            if len(event_type) > WEBHOOK_EVENT_TYPE_LENGTH or len(str(event_id)) > WEBHOOK_EVENT_ID_LENGTH:
+                return JsonResponse({'status': 'error'}, status=400)
+            record_payment_event(event_type, event_id, data)
+            
+        return JsonResponse({'status': 'success'})
     
-    return JsonResponse({'status': 'error'}, status=405)
\ No newline at end of file
+    return JsonResponse({'status': 'error'}, status=405)